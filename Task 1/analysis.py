@@ -1,22 +1,127 @@
-import psycopg2
+import argparse
+import subprocess
+import sys
 import time
 from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from tabulate import tabulate
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import close_pool, get_connection, release_connection
+from benchmarking import positive_int, save_results, summarize_timings
+from partitioning import PARTITIONED_TABLE, REVENUE_QUERY, WAU_QUERY
+from rollups import (REVENUE_ROLLUP_QUERY, WAU_ROLLUP_QUERY, load_wau_sketches,
+                     refresh_rollups, refresh_wau_sketches)
+from query_plans import diff_plans, explain_analyze, format_plan_diff, partition_scan_stats
+
+# Weekly Active Users: basic query
+WAU_BASIC_QUERY = """
+SELECT 
+    DATE_TRUNC('week', timestamp) as week,
+    COUNT(DISTINCT user_id) as active_users
+FROM events
+GROUP BY week
+ORDER BY week;
+"""
+
+# Optimized query using date partitioning and index
+WAU_OPTIMIZED_QUERY = """
+SELECT 
+    DATE_TRUNC('week', timestamp) as week,
+    COUNT(DISTINCT user_id) as active_users
+FROM events
+WHERE timestamp >= CURRENT_DATE - INTERVAL '90 days'
+GROUP BY DATE_TRUNC('week', timestamp)
+ORDER BY week;
+"""
+
+# Revenue per Category: basic query
+REVENUE_BASIC_QUERY = """
+SELECT 
+    p.category,
+    SUM(p.price) as total_revenue
+FROM events e
+JOIN products p ON e.product_id = p.product_id
+WHERE e.event_type = 'purchased'
+GROUP BY p.category
+ORDER BY total_revenue DESC;
+"""
+
+# Optimized query using index-optimized joins
+REVENUE_OPTIMIZED_QUERY = """
+SELECT 
+    p.category,
+    SUM(p.price * event_counts.purchase_count) as total_revenue
+FROM products p
+JOIN (
+    SELECT product_id, COUNT(*) as purchase_count
+    FROM events 
+    WHERE event_type = 'purchased'
+    GROUP BY product_id
+) event_counts ON p.product_id = event_counts.product_id
+GROUP BY p.category
+ORDER BY total_revenue DESC;
+"""
+
+def results_match(expected, actual, rtol=1e-6):
+    """Whether two [(key, value)] results hold the same rows in any order, values within rtol
+
+    Keys are compared as timestamps when they are dates, so engines returning datetime,
+    pandas Timestamp or date agree; values are compared as floats to absorb Decimal sums.
+    """
+    def normalize(rows):
+        frame = pd.DataFrame([tuple(row)[:2] for row in rows], columns=["key", "value"])
+        if not frame.empty and not isinstance(frame["key"].iloc[0], str):
+            frame["key"] = pd.to_datetime(frame["key"])
+        frame["value"] = frame["value"].astype(float)
+        return frame.sort_values("key").reset_index(drop=True)
+
+    expected, actual = normalize(expected), normalize(actual)
+    if len(expected) != len(actual) or not expected["key"].equals(actual["key"]):
+        return False
+    return bool(np.allclose(expected["value"], actual["value"], rtol=rtol))
+
+
 class QueryAnalyzer:
-    def __init__(self):
-        self.conn = psycopg2.connect(
-            dbname="e-commerce_platform",
-            user="postgres",
-            password="Your Password",  # Replace with your actual password
-            host="localhost"
-        )
+    def __init__(self, warmup=1, repetitions=5, cache_mode="warm", drop_cache_command=None,
+                 explain=False):
+        self.warmup = warmup
+        self.repetitions = repetitions
+        # "warm" keeps caches between runs, "session-reset" only runs DISCARD ALL,
+        # "cold" also runs drop_cache_command to empty the page cache and shared_buffers
+        if cache_mode == "cold" and not drop_cache_command:
+            raise ValueError("cold cache mode needs a drop_cache_command; use session-reset to only DISCARD ALL")
+        self.cache_mode = cache_mode
+        self.drop_cache_command = drop_cache_command
+        self.explain = explain  # capture EXPLAIN (ANALYZE, BUFFERS) plans for each query pair
+        self.benchmark_results = []
+        self.plan_diffs = {}
+        self.connect()
+
+    def connect(self):
+        # Pooled connection, configured through the PG* environment variables
+        self.conn = get_connection()
         self.cur = self.conn.cursor()
-        
-    def benchmark_query(self, query, name="", batch_size=1000):
-        start_time = time.time()
+
+    def drop_caches(self):
+        """Reset caches before a timed run: run the OS/server cache drop command if any, then reset the session"""
+        if self.drop_cache_command:
+            # e.g. "sync && echo 3 > /proc/sys/vm/drop_caches && pg_ctl restart" drops the page cache
+            # and shared_buffers; a restart breaks every pooled connection, so the pool is rebuilt
+            self.cur.close()
+            release_connection(self.conn)
+            close_pool()
+            subprocess.run(self.drop_cache_command, shell=True, check=True)
+            self.connect()
+        self.conn.rollback()
+        self.conn.autocommit = True
+        self.cur.execute("DISCARD ALL")
+        self.conn.autocommit = False
+
+    def run_query(self, query, batch_size=1000):
         self.cur.execute(query)
         
         results = []
@@ -25,86 +130,300 @@ class QueryAnalyzer:
             if not batch:
                 break
             results.extend(batch)
-    
-        execution_time = time.time() - start_time
-        print(f"\n{name} Execution Time: {execution_time:.4f} seconds")
-        return results, execution_time
+        return results
 
-    def analyze_weekly_active_users(self):
-        print("\n=== Weekly Active Users Analysis ===")
-        
-        # Basic query
-        basic_query = """
+    def benchmark_query(self, query, name="", batch_size=1000):
+        """Run warmup iterations, then time N repetitions and record min/median/p95/stddev"""
+        for _ in range(self.warmup):
+            self.run_query(query, batch_size)
+
+        timings = []
+        for _ in range(self.repetitions):
+            if self.cache_mode != "warm":
+                self.drop_caches()
+            start_time = time.perf_counter()
+            results = self.run_query(query, batch_size)
+            timings.append(time.perf_counter() - start_time)
+
+        stats = summarize_timings(timings)
+        self.benchmark_results.append({
+            "name": name,
+            "mode": "buffered",
+            "cache_mode": self.cache_mode,
+            "warmup": self.warmup,
+            "rows": len(results),
+            **stats
+        })
+        print(f"\n{name} Execution Time: median {stats['median']:.4f}s "
+              f"(min {stats['min']:.4f}s, p95 {stats['p95']:.4f}s, "
+              f"stddev {stats['stddev']:.4f}s, {stats['runs']} runs)")
+        return results, stats['median']
+
+    def benchmark_callable(self, func, name="", mode="python"):
+        """Same warmup/repetition protocol as benchmark_query, for work done outside PostgreSQL"""
+        for _ in range(self.warmup):
+            func()
+
+        timings = []
+        for _ in range(self.repetitions):
+            start_time = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start_time)
+
+        stats = summarize_timings(timings)
+        self.benchmark_results.append({
+            "name": name,
+            "mode": mode,
+            "cache_mode": self.cache_mode,
+            "warmup": self.warmup,
+            "rows": len(result) if hasattr(result, "__len__") else None,
+            **stats
+        })
+        print(f"\n{name} Execution Time: median {stats['median']:.4f}s "
+              f"(min {stats['min']:.4f}s, p95 {stats['p95']:.4f}s, "
+              f"stddev {stats['stddev']:.4f}s, {stats['runs']} runs)")
+        return result, stats['median']
+
+    def stream_query(self, query, itersize=2000):
+        """Yield rows from a named server-side cursor, fetching itersize rows per round trip"""
+        self._stream_id = getattr(self, "_stream_id", 0) + 1
+        with self.conn.cursor(name=f"analysis_stream_{self._stream_id}") as cur:
+            cur.itersize = itersize
+            cur.execute(query)
+            yield from cur
+        self.conn.rollback()
+
+    def benchmark_streaming(self, query, name="", itersize=2000):
+        """Benchmark a query through a server-side cursor, reporting time-to-first-row and total time"""
+        for _ in range(self.warmup):
+            for _ in self.stream_query(query, itersize):
+                pass
+
+        timings = []
+        first_row_timings = []
+        for _ in range(self.repetitions):
+            if self.cache_mode != "warm":
+                self.drop_caches()
+            rows = 0
+            start_time = time.perf_counter()
+            first_row_time = None
+            for _ in self.stream_query(query, itersize):
+                if first_row_time is None:
+                    first_row_time = time.perf_counter() - start_time
+                rows += 1
+            timings.append(time.perf_counter() - start_time)
+            first_row_timings.append(first_row_time if first_row_time is not None else timings[-1])
+
+        stats = summarize_timings(timings)
+        first_row = summarize_timings(first_row_timings)
+        self.benchmark_results.append({
+            "name": name,
+            "mode": f"stream(itersize={itersize})",
+            "cache_mode": self.cache_mode,
+            "warmup": self.warmup,
+            "rows": rows,
+            **stats,
+            "first_row_median": first_row["median"],
+            "first_row_p95": first_row["p95"]
+        })
+        print(f"\n{name} Streaming Time: first row {first_row['median']:.4f}s, "
+              f"total median {stats['median']:.4f}s (p95 {stats['p95']:.4f}s, {rows:,} rows)")
+        return rows, stats['median']
+
+    def analyze_streaming(self, itersize=2000):
+        """Measure large per-user and per-event result sets with constant client memory"""
+        print("\n=== Streaming Result Sets ===")
+
+        per_user_query = """
         SELECT 
-            DATE_TRUNC('week', timestamp) as week,
-            COUNT(DISTINCT user_id) as active_users
+            user_id,
+            COUNT(*) as events,
+            MAX(timestamp) as last_seen
         FROM events
-        GROUP BY week
-        ORDER BY week;
+        GROUP BY user_id;
         """
-        
-        # Optimized query using date partitioning and index
-        optimized_query = """
-        SELECT 
-            DATE_TRUNC('week', timestamp) as week,
-            COUNT(DISTINCT user_id) as active_users
-        FROM events
-        WHERE timestamp >= CURRENT_DATE - INTERVAL '90 days'
-        GROUP BY DATE_TRUNC('week', timestamp)
-        ORDER BY week;
+
+        per_event_query = """
+        SELECT event_id, user_id, event_type, product_id, timestamp
+        FROM events;
         """
+
+        self.benchmark_streaming(per_user_query, "Per-User Activity", itersize)
+        self.benchmark_streaming(per_event_query, "Per-Event Export", itersize)
+
+    def compare_plans(self, name, basic_query, optimized_query):
+        """Capture JSON plans for a basic/optimized pair and keep their structural diff"""
+        basic_plan = explain_analyze(self.cur, basic_query)
+        optimized_plan = explain_analyze(self.cur, optimized_query)
+        self.conn.rollback()
+        self.plan_diffs[name] = diff_plans(basic_plan, optimized_plan)
+        return self.plan_diffs[name]
+
+    def analyze_weekly_active_users(self):
+        print("\n=== Weekly Active Users Analysis ===")
         
-        basic_results, basic_time = self.benchmark_query(basic_query, "Basic WAU Query")
-        opt_results, opt_time = self.benchmark_query(optimized_query, "Optimized WAU Query")
+        basic_results, basic_time = self.benchmark_query(WAU_BASIC_QUERY, "Basic WAU Query")
+        opt_results, opt_time = self.benchmark_query(WAU_OPTIMIZED_QUERY, "Optimized WAU Query")
+        if self.explain:
+            self.compare_plans("Weekly Active Users", WAU_BASIC_QUERY, WAU_OPTIMIZED_QUERY)
         
         return basic_results, opt_results, basic_time, opt_time
 
     def analyze_revenue_per_category(self):
         print("\n=== Revenue per Category Analysis ===")
         
-        # Basic query
-        basic_query = """
-        SELECT 
-            p.category,
-            SUM(p.price) as total_revenue
-        FROM events e
-        JOIN products p ON e.product_id = p.product_id
-        WHERE e.event_type = 'purchased'
-        GROUP BY p.category
-        ORDER BY total_revenue DESC;
-        """
-        
-        # Optimized query using index-optimized joins
-        optimized_query = """
-        SELECT 
-            p.category,
-            SUM(p.price * event_counts.purchase_count) as total_revenue
-        FROM products p
-        JOIN (
-            SELECT product_id, COUNT(*) as purchase_count
-            FROM events 
-            WHERE event_type = 'purchased'
-            GROUP BY product_id
-        ) event_counts ON p.product_id = event_counts.product_id
-        GROUP BY p.category
-        ORDER BY total_revenue DESC;
-        """
-        
-        basic_results, basic_time = self.benchmark_query(basic_query, "Basic Revenue Query")
-        opt_results, opt_time = self.benchmark_query(optimized_query, "Optimized Revenue Query")
+        basic_results, basic_time = self.benchmark_query(REVENUE_BASIC_QUERY, "Basic Revenue Query")
+        opt_results, opt_time = self.benchmark_query(REVENUE_OPTIMIZED_QUERY, "Optimized Revenue Query")
+        if self.explain:
+            self.compare_plans("Revenue per Category", REVENUE_BASIC_QUERY, REVENUE_OPTIMIZED_QUERY)
         
         return basic_results, opt_results, basic_time, opt_time
 
+    def analyze_partitioning(self, flat_table="events", partitioned_table=PARTITIONED_TABLE):
+        """Compare the windowed WAU and revenue queries on the flat and the partitioned events table"""
+        print("\n=== Flat vs Partitioned Events ===")
+        self.cur.execute("SELECT COUNT(*) FROM pg_inherits WHERE inhparent = to_regclass(%s)",
+                         (partitioned_table,))
+        total_partitions = self.cur.fetchone()[0]
+
+        rows = []
+        for query_type, template in [("Weekly Active Users", WAU_QUERY),
+                                     ("Revenue per Category", REVENUE_QUERY)]:
+            flat_query = template.format(table=flat_table)
+            partitioned_query = template.format(table=partitioned_table)
+            _, flat_time = self.benchmark_query(flat_query, f"{query_type} (flat)")
+            _, partitioned_time = self.benchmark_query(partitioned_query, f"{query_type} (partitioned)")
+
+            flat_plan = explain_analyze(self.cur, flat_query)
+            partitioned_plan = explain_analyze(self.cur, partitioned_query)
+            self.conn.rollback()
+            pruning = partition_scan_stats(partitioned_plan, partitioned_table)
+            self.plan_diffs[f"{query_type} (flat vs partitioned)"] = diff_plans(flat_plan, partitioned_plan)
+
+            rows.append({
+                'Query Type': query_type,
+                'Flat Median (s)': flat_time,
+                'Partitioned Median (s)': partitioned_time,
+                'Partitions Scanned': f"{pruning['partitions_scanned']}/{total_partitions}",
+                'Subplans Pruned': pruning['subplans_removed'],
+                'Flat Buffers': flat_plan["Plan"].get("Shared Hit Blocks", 0)
+                                + flat_plan["Plan"].get("Shared Read Blocks", 0),
+                'Partitioned Buffers': partitioned_plan["Plan"].get("Shared Hit Blocks", 0)
+                                       + partitioned_plan["Plan"].get("Shared Read Blocks", 0)
+            })
+
+        print("\nPartition Pruning Summary:")
+        print(tabulate(pd.DataFrame(rows), headers='keys', tablefmt='pipe', floatfmt='.4f', showindex=False))
+        return rows
+
+    def analyze_rollups(self, refresh=True):
+        """Answer WAU and revenue per category from the weekly rollup tables instead of raw events"""
+        print("\n=== Rollup Tables vs Raw Events ===")
+        if refresh:
+            refresh_rollups(self.conn)
+
+        rows = []
+        for query_type, raw_query, rollup_query in [
+            ("Weekly Active Users", WAU_BASIC_QUERY, WAU_ROLLUP_QUERY),
+            ("Revenue per Category", REVENUE_BASIC_QUERY, REVENUE_ROLLUP_QUERY)
+        ]:
+            raw_results, raw_time = self.benchmark_query(raw_query, f"{query_type} (raw events)")
+            rollup_results, rollup_time = self.benchmark_query(rollup_query, f"{query_type} (rollup)")
+            rows.append({
+                'Query Type': query_type,
+                'Raw Median (s)': raw_time,
+                'Rollup Median (s)': rollup_time,
+                'Speedup (x)': raw_time / rollup_time if rollup_time else float("inf"),
+                'Results Match': [r[1] for r in raw_results] == [r[1] for r in rollup_results]
+            })
+
+        print("\nRollup Summary:")
+        print(tabulate(pd.DataFrame(rows), headers='keys', tablefmt='pipe', floatfmt='.4f', showindex=False))
+        return rows
+
+    def analyze_approximate_wau(self, precision=14, refresh=True):
+        """Compare exact COUNT(DISTINCT) WAU with estimates from the per-week HyperLogLog sketches"""
+        print("\n=== Approximate WAU (HyperLogLog) ===")
+        if refresh:
+            refresh_wau_sketches(self.conn, precision)
+
+        exact_results, exact_time = self.benchmark_query(WAU_BASIC_QUERY, "Exact WAU Query")
+
+        def estimate_wau():
+            sketches = load_wau_sketches(self.cur)
+            self.conn.rollback()
+            return sketches, {week: sketch.estimate() for week, sketch in sketches.items()}
+
+        (sketches, estimates), approx_time = self.benchmark_callable(
+            estimate_wau, "Approximate WAU (HLL)", f"hll(p={precision})"
+        )
+
+        errors = []
+        for week, exact in exact_results:
+            if week is None:
+                continue
+            estimate = estimates.get(week.date(), 0.0)
+            errors.append(abs(estimate - exact) / exact)
+        bound = next(iter(sketches.values())).relative_error if sketches else float("nan")
+
+        summary = pd.DataFrame([{
+            'Exact Median (s)': exact_time,
+            'Approximate Median (s)': approx_time,
+            'Speedup (x)': exact_time / approx_time if approx_time else float("inf"),
+            'Mean Error (%)': 100 * sum(errors) / len(errors) if errors else float("nan"),
+            'Max Error (%)': 100 * max(errors) if errors else float("nan"),
+            'Stated Std Error (%)': 100 * bound
+        }])
+        print("\nAccuracy vs Speed:")
+        print(tabulate(summary, headers='keys', tablefmt='pipe', floatfmt='.4f', showindex=False))
+        return summary
+
+    def analyze_offline(self, data_dir="parquet", engines=("duckdb", "pandas")):
+        """Run WAU and revenue over the Parquet export with columnar engines, next to the SQL versions"""
+        from offline_engine import OfflineEngine
+
+        print("\n=== PostgreSQL vs Offline Columnar Engines ===")
+        analyses = {
+            "Weekly Active Users": (WAU_BASIC_QUERY, "WAU", lambda engine: engine.weekly_active_users),
+            "WAU last 90 days": (WAU_OPTIMIZED_QUERY, "WAU 90d",
+                                 lambda engine: lambda: engine.weekly_active_users(days=90)),
+            "Revenue per Category": (REVENUE_OPTIMIZED_QUERY, "Revenue", lambda engine: engine.revenue_per_category),
+        }
+        expected = {}
+        rows = {}
+        for analysis, (query, name, _) in analyses.items():
+            expected[analysis], sql_time = self.benchmark_query(query, f"{name} (sql)")
+            rows[analysis] = {"PostgreSQL (s)": sql_time}
+        for engine_name in engines:
+            try:
+                engine = OfflineEngine(data_dir, engine_name)
+            except ImportError as e:
+                print(f"Skipping {engine_name}: {e}")
+                continue
+            for analysis, (_, name, method) in analyses.items():
+                result, seconds = self.benchmark_callable(method(engine), f"{name} ({engine_name})", engine_name)
+                matches = results_match(expected[analysis], result)
+                if not matches:
+                    # A wrong answer is not a speed-up, so its timing is left out of the comparison
+                    print(f"Warning: {engine_name} returned different results than PostgreSQL for {analysis}")
+                rows[analysis][f"{engine_name} (s)"] = seconds if matches else float("nan")
+                rows[analysis][f"{engine_name} match"] = matches
+
+        summary = pd.DataFrame.from_dict(rows, orient="index")
+        print("\nEngine Comparison (median, mismatched results left empty):")
+        print(tabulate(summary, headers='keys', tablefmt='pipe', floatfmt='.4f'))
+        return summary
+
     def create_performance_report(self):
         # Run analyses
         wau_basic, wau_opt, wau_basic_time, wau_opt_time = self.analyze_weekly_active_users()
         rev_basic, rev_opt, rev_basic_time, rev_opt_time = self.analyze_revenue_per_category()
         
-        # Create performance summary
+        # Create performance summary (median of the timed repetitions)
         performance_summary = pd.DataFrame({
             'Query Type': ['Weekly Active Users', 'Revenue per Category'],
-            'Basic Time (s)': [wau_basic_time, rev_basic_time],
-            'Optimized Time (s)': [wau_opt_time, rev_opt_time],
+            'Basic Median (s)': [wau_basic_time, rev_basic_time],
+            'Optimized Median (s)': [wau_opt_time, rev_opt_time],
             'Improvement (%)': [
                 ((wau_basic_time - wau_opt_time) / wau_basic_time) * 100,
                 ((rev_basic_time - rev_opt_time) / rev_basic_time) * 100
@@ -116,10 +435,80 @@ class QueryAnalyzer:
         print("\nQuery Performance Summary:")
         print(tabulate(performance_summary, headers='keys', tablefmt='pipe', floatfmt='.4f'))
 
+        print("\nTiming Distribution:")
+        distribution = pd.DataFrame(self.benchmark_results)[
+            ['name', 'mode', 'runs', 'min', 'median', 'p95', 'stddev']
+        ]
+        print(tabulate(distribution, headers='keys', tablefmt='pipe', floatfmt='.4f', showindex=False))
+
+        if self.plan_diffs:
+            print("\n=== Query Plans (EXPLAIN ANALYZE, BUFFERS) ===")
+            for name, diff in self.plan_diffs.items():
+                print(format_plan_diff(name, diff))
+
     def __del__(self):
-        self.cur.close()
-        self.conn.close()
+        # __init__ may fail before a connection was borrowed
+        conn = getattr(self, "conn", None)
+        if conn is not None:
+            self.cur.close()
+            release_connection(conn)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Task 1 analysis queries")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="untimed runs before measuring each query")
+    parser.add_argument("--repetitions", type=positive_int, default=5,
+                        help="timed runs per query")
+    parser.add_argument("--cache-mode", choices=["warm", "session-reset", "cold"], default="warm",
+                        help="warm: keep caches, session-reset: DISCARD ALL before every timed run, "
+                             "cold: also run --drop-cache-command")
+    parser.add_argument("--drop-cache-command", default=None,
+                        help="shell command run before each cold run to drop OS/server caches (required by cold)")
+    parser.add_argument("--explain", action="store_true",
+                        help="capture and diff EXPLAIN (ANALYZE, BUFFERS) plans for each query pair")
+    parser.add_argument("--stream", action="store_true",
+                        help="also benchmark large result sets through server-side cursors")
+    parser.add_argument("--itersize", type=int, default=2000,
+                        help="rows fetched per round trip by server-side cursors")
+    parser.add_argument("--partitioned", action="store_true",
+                        help="compare the flat events table with its partitioned copy")
+    parser.add_argument("--flat-table", default="events",
+                        help="flat events table (events_flat after 'partitioning.py migrate --swap')")
+    parser.add_argument("--partitioned-table", default=PARTITIONED_TABLE,
+                        help="partitioned events table ('events' after a swap)")
+    parser.add_argument("--rollups", action="store_true",
+                        help="refresh the weekly rollup tables and compare them with the raw queries")
+    parser.add_argument("--approximate", action="store_true",
+                        help="compare exact WAU with HyperLogLog estimates from the sketch table")
+    parser.add_argument("--precision", type=int, default=14,
+                        help="HyperLogLog precision for --approximate")
+    parser.add_argument("--offline", default=None, metavar="PARQUET_DIR",
+                        help="also run the analyses over a parquet_export.py export with DuckDB and pandas")
+    parser.add_argument("--output", default=None,
+                        help="append results to this .json or .csv file")
+    parser.add_argument("--release", default=None,
+                        help="release label stored with the results")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    analyzer = QueryAnalyzer()
+    args = parse_args()
+    analyzer = QueryAnalyzer(
+        warmup=args.warmup,
+        repetitions=args.repetitions,
+        cache_mode=args.cache_mode,
+        drop_cache_command=args.drop_cache_command,
+        explain=args.explain
+    )
+    if args.stream:
+        analyzer.analyze_streaming(args.itersize)
+    if args.partitioned:
+        analyzer.analyze_partitioning(args.flat_table, args.partitioned_table)
+    if args.rollups:
+        analyzer.analyze_rollups()
+    if args.approximate:
+        analyzer.analyze_approximate_wau(args.precision)
+    if args.offline:
+        analyzer.analyze_offline(args.offline)
     analyzer.create_performance_report()
+    if args.output:
+        save_results(analyzer.benchmark_results, args.output, release=args.release)
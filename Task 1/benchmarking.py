@@ -0,0 +1,73 @@
+import argparse
+import csv
+import json
+import os
+import statistics
+from datetime import datetime
+
+
+def positive_int(text):
+    """argparse type for counts that must be at least 1, such as timed repetitions"""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers (pct in 0-100)"""
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize_timings(timings):
+    """Summary statistics for a list of timings in seconds"""
+    return {
+        "runs": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "p95": percentile(timings, 95),
+        "max": max(timings),
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def save_results(records, path, release=None):
+    """Append benchmark records to a JSON or CSV file, chosen by the file extension"""
+    recorded_at = datetime.now().isoformat(timespec="seconds")
+    rows = [{"release": release, "recorded_at": recorded_at, **record} for record in records]
+
+    if path.endswith(".csv"):
+        history = []
+        fieldnames = []
+        if os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                fieldnames = list(reader.fieldnames or [])
+                history = list(reader)
+        new_fields = [key for key in dict.fromkeys(key for row in rows for key in row) if key not in fieldnames]
+        if history and not new_fields:
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=fieldnames).writerows(rows)
+        else:
+            # New columns: rewrite the file under the combined header, older rows leave them empty
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=fieldnames + new_fields)
+                writer.writeheader()
+                writer.writerows(history + rows)
+    else:
+        history = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                history = json.load(f)
+        history.extend(rows)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2)
+
+    print(f"Saved {len(rows)} benchmark records to '{path}'")
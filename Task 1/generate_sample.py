@@ -1,55 +1,33 @@
+import argparse
+import io
+import multiprocessing
 import psycopg2
-import random
+import sys
+import time
 from datetime import datetime, timedelta
+from pathlib import Path
 
-try:
-    # Connect to PostgreSQL
-    conn = psycopg2.connect(
-        dbname="e-commerce_platform",
-        user="postgres",
-        password="Your Password",
-        host="localhost"
-    )
-    cur = conn.cursor()
-
-    # Clear existing data
-    cur.execute("TRUNCATE TABLE events, products, users CASCADE")
-
-    # Generate users
-    print("Generating users...")
-    countries = ['US', 'UK', 'MAR', 'FR', 'CA', 'JP']
-    for i in range(1, 1001):
-        signup_date = datetime.now() - timedelta(days=random.randint(1, 365))
-        country = random.choice(countries)
-        cur.execute("INSERT INTO users (signup_date, country) VALUES (%s, %s)", 
-                   (signup_date, country))
-
-    # Generate products
-    print("Generating products...")
-    categories = ['Electronics', 'Clothing', 'Home', 'Books', 'Toys']
-    for i in range(1, 101):
-        category = random.choice(categories)
-        price = round(random.uniform(5, 500), 2)
-        cur.execute("INSERT INTO products (category, price) VALUES (%s, %s)", 
-                   (category, price))
-
-    # Generate events
-    print("Generating events...")
-    event_types = [
-        'view_item',
-        'view_item_list',
-        'add_to_cart',
-        'view_cart',
-        'remove_from_cart',
-        'add_to_wishlist',
-        'begin_checkout',
-        'add_payment_info',
-        'add_shipping_info',
-        'purchase'
-    ]
-    
-    # Create weighted probabilities for event types (some events should occur more frequently than others)
-    event_weights = {
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import EVENT_LOAD_LOCK, get_connection, release_connection
+from partitioning import ensure_partitions
+from rollups import reset_rollups
+
+countries = ['US', 'UK', 'MAR', 'FR', 'CA', 'JP']
+categories = ['Electronics', 'Clothing', 'Home', 'Books', 'Toys']
+
+# Weighted event types. "schema" is what the events CHECK constraint accepts and what the Task 1
+# analyses filter on; "ga4" is the GA4 e-commerce vocabulary categorized in Task 4, and loads only
+# into an events table without that constraint
+EVENT_TYPE_WEIGHTS = {
+    "schema": {
+        'viewed': 1,
+        'add-to-cart': 1,
+        'purchased': 1
+    },
+    "ga4": {
         'view_item': 30,
         'view_item_list': 25,
         'add_to_cart': 15,
@@ -60,26 +38,250 @@ try:
         'add_payment_info': 3,
         'add_shipping_info': 3,
         'purchase': 2
-    }
-
-    for i in range(1, 10001):
-        user_id = random.randint(1, 1000)
-        event_type = random.choices(
-            population=list(event_weights.keys()),
-            weights=list(event_weights.values())
-        )[0]
-        product_id = random.randint(1, 100)
-        timestamp = datetime.now() - timedelta(days=random.randint(0, 30))
-        cur.execute("INSERT INTO events (user_id, event_type, product_id, timestamp) VALUES (%s, %s, %s, %s)", 
-                   (user_id, event_type, product_id, timestamp))
-
-    conn.commit()
-    print("Sample data generated successfully!")
-
-except psycopg2.Error as e:
-    print(f"An error occurred: {e}")
-finally:
-    if cur:
-        cur.close()
-    if conn:
-        conn.close()
\ No newline at end of file
+    },
+}
+
+
+def event_type_distribution(event_types="schema"):
+    """(event type names, probabilities) of one vocabulary"""
+    weights = EVENT_TYPE_WEIGHTS[event_types]
+    probabilities = np.array(list(weights.values()), dtype=float)
+    return np.array(list(weights)), probabilities / probabilities.sum()
+
+
+USER_COLUMNS = ("signup_date", "country")
+PRODUCT_COLUMNS = ("category", "price")
+EVENT_COLUMNS = ("user_id", "event_type", "product_id", "timestamp")
+
+
+def _chunk_sizes(total, chunk_size):
+    for start in range(0, total, chunk_size):
+        yield min(chunk_size, total - start)
+
+
+def generate_users(rng, num_users, end_time, chunk_size=100_000):
+    """Yield DataFrame chunks of (signup_date, country)"""
+    for size in _chunk_sizes(num_users, chunk_size):
+        days_ago = rng.integers(1, 366, size=size).astype("timedelta64[D]")
+        yield pd.DataFrame({
+            "signup_date": np.datetime64(end_time.date(), "D") - days_ago,
+            "country": rng.choice(countries, size=size),
+        })
+
+
+def generate_products(rng, num_products, chunk_size=100_000):
+    """Yield DataFrame chunks of (category, price)"""
+    for size in _chunk_sizes(num_products, chunk_size):
+        yield pd.DataFrame({
+            "category": rng.choice(categories, size=size),
+            "price": np.round(rng.uniform(5, 500, size=size), 2),
+        })
+
+
+def generate_event_chunk(rng, size, num_users, num_products, days, end_time, event_types="schema"):
+    """Draw one chunk of events with vectorized user ids, weighted types, products and timestamps"""
+    names, probabilities = event_type_distribution(event_types)
+    seconds_ago = rng.integers(0, days * 86_400, size=size).astype("timedelta64[s]")
+    return pd.DataFrame({
+        "user_id": rng.integers(1, num_users + 1, size=size),
+        "event_type": names[rng.choice(len(names), size=size, p=probabilities)],
+        "product_id": rng.integers(1, num_products + 1, size=size),
+        "timestamp": np.datetime64(end_time, "s") - seconds_ago,
+    })
+
+
+def plan_event_chunks(num_events, chunk_size=100_000):
+    """Split the event range into (chunk_index, size) pairs"""
+    return list(enumerate(_chunk_sizes(num_events, chunk_size)))
+
+
+def split_chunks(chunks, workers):
+    """Split the chunk plan into contiguous partitions, one per worker"""
+    bounds = np.linspace(0, len(chunks), workers + 1).astype(int)
+    return [chunks[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def event_chunk_rng(seed, chunk_index):
+    """Deterministic RNG sub-stream for one event chunk, independent of the worker layout"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+
+
+def generate_events(seed, chunks, num_users, num_products, days, end_time, event_types="schema"):
+    """Yield DataFrame chunks of (user_id, event_type, product_id, timestamp)"""
+    for chunk_index, size in chunks:
+        rng = event_chunk_rng(seed, chunk_index)
+        yield generate_event_chunk(rng, size, num_users, num_products, days, end_time, event_types)
+
+
+def insert_rows(cur, table, columns, frames):
+    """Insert rows one statement at a time (original loader)"""
+    placeholders = ", ".join(["%s"] * len(columns))
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    count = 0
+    for frame in frames:
+        for row in frame.astype(object).itertuples(index=False, name=None):
+            cur.execute(statement, row)
+            count += 1
+    return count
+
+
+def copy_rows(cur, table, columns, frames):
+    """Stream each chunk into a table with COPY FROM STDIN from an in-memory buffer"""
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    count = 0
+    for frame in frames:
+        buffer = io.StringIO()
+        frame.to_csv(buffer, sep="\t", header=False, index=False,
+                     date_format="%Y-%m-%d %H:%M:%S")
+        buffer.seek(0)
+        cur.copy_expert(statement, buffer)
+        count += len(frame)
+    return count
+
+
+def load_table(cur, table, columns, frames, mode="insert"):
+    """Load chunks with the selected loader and report throughput"""
+    start_time = time.perf_counter()
+    if mode == "copy":
+        count = copy_rows(cur, table, columns, frames)
+    else:
+        count = insert_rows(cur, table, columns, frames)
+    elapsed = time.perf_counter() - start_time
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"Loaded {count:,} rows into {table} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return count, elapsed
+
+
+def load_event_partition(worker_id, chunks, args, end_time):
+    """Worker entry point: load one partition of the event range on its own connection"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            start_time = time.perf_counter()
+            frames = generate_events(args.seed, chunks, args.users, args.products,
+                                     args.days, end_time, args.event_types)
+            if args.mode == "copy":
+                count = copy_rows(cur, "events", EVENT_COLUMNS, frames)
+            else:
+                count = insert_rows(cur, "events", EVENT_COLUMNS, frames)
+            conn.commit()
+            elapsed = time.perf_counter() - start_time
+    finally:
+        release_connection(conn)
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"[worker {worker_id}] Loaded {count:,} events in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return worker_id, count, elapsed
+
+
+def load_events_parallel(args, end_time):
+    """Split the event chunks across a process pool and load the partitions concurrently"""
+    partitions = split_chunks(plan_event_chunks(args.events, args.chunk_size), args.workers)
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(processes=args.workers) as pool:
+        reports = pool.starmap(
+            load_event_partition,
+            [(worker_id, chunks, args, end_time) for worker_id, chunks in enumerate(partitions)]
+        )
+    elapsed = time.perf_counter() - start_time
+    count = sum(rows for _, rows, _ in reports)
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"Loaded {count:,} rows into events with {args.workers} workers "
+          f"in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return count, elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate sample e-commerce data")
+    parser.add_argument("--mode", choices=["insert", "copy"], default="insert",
+                        help="insert: one INSERT per row, copy: bulk COPY FROM STDIN")
+    parser.add_argument("--users", type=int, default=1000,
+                        help="number of users to generate")
+    parser.add_argument("--products", type=int, default=100,
+                        help="number of products to generate")
+    parser.add_argument("--events", type=int, default=10_000,
+                        help="number of events to generate")
+    parser.add_argument("--days", type=int, default=30,
+                        help="events are spread over this many days before --end-date")
+    parser.add_argument("--end-date", type=datetime.fromisoformat, default=None,
+                        help="latest event timestamp, ISO format (default: start of tomorrow)")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="random seed, the same seed and knobs give the same dataset")
+    parser.add_argument("--chunk-size", type=int, default=100_000,
+                        help="rows generated and buffered in memory per chunk")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes loading disjoint partitions of the event range")
+    parser.add_argument("--event-types", choices=list(EVENT_TYPE_WEIGHTS), default="schema",
+                        help="schema: viewed/add-to-cart/purchased as the events table allows, "
+                             "ga4: the GA4 names used by Task 4 (needs events without the CHECK constraint)")
+    parser.add_argument("--partition-by", choices=["week", "month"], default=None,
+                        help="events is range-partitioned: create the partitions covering --days first")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    end_time = args.end_date or datetime.combine(datetime.now().date() + timedelta(days=1),
+                                                 datetime.min.time())
+    rng = np.random.default_rng(args.seed)
+    conn = None
+    cur = None
+    try:
+        # Borrow a pooled PostgreSQL connection (configured through PG* environment variables)
+        conn = get_connection()
+        cur = conn.cursor()
+        # Held for the whole load, so rollup refreshes wait until every event is committed
+        cur.execute("SELECT pg_advisory_lock_shared(%s)", (EVENT_LOAD_LOCK,))
+
+        # Clear existing data; event ids restart at 1, so the rollups built on them start over too
+        cur.execute("TRUNCATE TABLE events, products, users RESTART IDENTITY CASCADE")
+        reset_rollups(cur)
+        if args.partition_by:
+            created = ensure_partitions(cur, "events", end_time - timedelta(days=args.days),
+                                        end_time, args.partition_by)
+            print(f"Created {created} {args.partition_by}ly partitions on events")
+
+        total_start = time.perf_counter()
+
+        print("Generating users...")
+        load_table(cur, "users", USER_COLUMNS,
+                   generate_users(rng, args.users, end_time, args.chunk_size), args.mode)
+
+        print("Generating products...")
+        load_table(cur, "products", PRODUCT_COLUMNS,
+                   generate_products(rng, args.products, args.chunk_size), args.mode)
+
+        print("Generating events...")
+        if args.workers > 1:
+            # Workers reference users/products through foreign keys, so those must be visible first
+            conn.commit()
+            load_events_parallel(args, end_time)
+        else:
+            load_table(cur, "events", EVENT_COLUMNS,
+                       generate_events(args.seed, plan_event_chunks(args.events, args.chunk_size),
+                                       args.users, args.products, args.days, end_time, args.event_types),
+                       args.mode)
+            conn.commit()
+
+        cur.execute("SELECT COUNT(*) FROM events")
+        loaded = cur.fetchone()[0]
+        if loaded != args.events:
+            print(f"Warning: expected {args.events:,} events but found {loaded:,}")
+
+        total_time = time.perf_counter() - total_start
+        print(f"Sample data generated successfully in {total_time:.2f}s!")
+
+    except psycopg2.Error as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            if not conn.closed:
+                conn.rollback()
+                with conn.cursor() as unlock:
+                    unlock.execute("SELECT pg_advisory_unlock_shared(%s)", (EVENT_LOAD_LOCK,))
+            release_connection(conn)
+
+
+if __name__ == "__main__":
+    main()
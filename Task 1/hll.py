@@ -0,0 +1,77 @@
+import numpy as np
+
+
+def hash64(values):
+    """SplitMix64 finalizer over an integer array, vectorized (uint64 arithmetic wraps)"""
+    x = np.asarray(values).astype(np.uint64)
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(x):
+    """Exact bit length of a uint64 array (frexp is exact on each 32-bit half)"""
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+class HyperLogLog:
+    """Mergeable HyperLogLog sketch of distinct integer ids"""
+
+    def __init__(self, precision=14, registers=None):
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is None:
+            registers = np.zeros(self.m, dtype=np.uint8)
+        self.registers = registers
+
+    @property
+    def relative_error(self):
+        """Standard error of the estimate, 1.04 / sqrt(m)"""
+        return 1.04 / np.sqrt(self.m)
+
+    def add(self, ids):
+        """Add an array of integer ids"""
+        hashes = hash64(ids)
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        # Position of the leftmost 1 bit in the suffix, suffix_bits + 1 when it is all zeros
+        rank = (suffix_bits - _bit_length(suffix) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        """Union with another sketch of the same precision, in place"""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * np.log(m / zeros)
+        return raw
+
+    def to_bytes(self):
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, precision):
+        return cls(precision, np.frombuffer(data, dtype=np.uint8).copy())
+
+
+def merge_sketches(sketches):
+    """Union of several sketches, e.g. several weeks or partitions"""
+    sketches = list(sketches)
+    merged = HyperLogLog(sketches[0].precision)
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
@@ -0,0 +1,185 @@
+import argparse
+import time
+from datetime import datetime
+
+import pandas as pd
+from tabulate import tabulate
+
+from analysis import (REVENUE_BASIC_QUERY, REVENUE_OPTIMIZED_QUERY, WAU_BASIC_QUERY,
+                      WAU_OPTIMIZED_QUERY, QueryAnalyzer)
+from benchmarking import positive_int, save_results, summarize_timings
+from generate_sample import EVENT_COLUMNS, copy_rows, generate_events, plan_event_chunks
+from query_plans import explain_analyze, summarize_plan
+
+WORKLOAD = {
+    "wau_basic": WAU_BASIC_QUERY,
+    "wau_optimized": WAU_OPTIMIZED_QUERY,
+    "revenue_basic": REVENUE_BASIC_QUERY,
+    "revenue_optimized": REVENUE_OPTIMIZED_QUERY,
+}
+
+# {table} is filled in so the same index can be built on the scratch table for the write probe
+CANDIDATES = {
+    "adv_type_product": "CREATE INDEX {name} ON {table} (event_type, product_id)",
+    "adv_timestamp_user": "CREATE INDEX {name} ON {table} (timestamp, user_id)",
+    "adv_type_cover_product": "CREATE INDEX {name} ON {table} (event_type) INCLUDE (product_id)",
+    "adv_timestamp_cover_user": "CREATE INDEX {name} ON {table} (timestamp) INCLUDE (user_id)",
+    "adv_purchased_product": "CREATE INDEX {name} ON {table} (product_id) WHERE event_type = 'purchased'",
+    "adv_timestamp_brin": "CREATE INDEX {name} ON {table} USING brin (timestamp)",
+}
+
+PROBE_TABLE = "index_probe_events"
+
+
+class IndexAdvisor:
+    def __init__(self, analyzer, candidates=None, min_gain=0.02):
+        self.analyzer = analyzer
+        self.cur = analyzer.cur
+        self.conn = analyzer.conn
+        self.candidates = candidates or CANDIDATES
+        self.min_gain = min_gain  # relative workload improvement needed to keep an index
+
+    def _execute(self, statement):
+        self.cur.execute(statement)
+        self.conn.commit()
+
+    def create_indexes(self, names, table="events"):
+        for name in names:
+            self._execute(self.candidates[name].format(name=f"{table}_{name}", table=table))
+        self._execute(f"ANALYZE {table}")
+
+    def drop_indexes(self, names, table="events"):
+        for name in names:
+            self._execute(f"DROP INDEX IF EXISTS {table}_{name}")
+
+    def index_size(self, name, table="events"):
+        self.cur.execute("SELECT pg_relation_size(to_regclass(%s))", (f"{table}_{name}",))
+        return self.cur.fetchone()[0]
+
+    def benchmark_workload(self, label):
+        """Median time of every workload query, plus the indexes each plan actually used"""
+        timings = {}
+        used = set()
+        for query_name, query in WORKLOAD.items():
+            _, timings[query_name] = self.analyzer.benchmark_query(query, f"{query_name} [{label}]")
+            plan = summarize_plan(explain_analyze(self.cur, query))
+            used.update(node["node"].split(" using ")[1] for node in plan["nodes"] if " using " in node["node"])
+        self.conn.rollback()
+        return timings, used
+
+    def evaluate_candidates(self):
+        """Benchmark the workload with each candidate index alone, against the baseline"""
+        baseline, _ = self.benchmark_workload("baseline")
+        results = []
+        for name in self.candidates:
+            self.create_indexes([name])
+            try:
+                timings, used = self.benchmark_workload(name)
+                size = self.index_size(name)
+            finally:
+                self.drop_indexes([name])
+            gain = 1 - sum(timings.values()) / sum(baseline.values())
+            results.append({
+                "index": name,
+                "workload_gain_pct": 100 * gain,
+                "used_by_planner": f"events_{name}" in used,
+                "size_mb": size / 1024 / 1024,
+                **{f"{q} (s)": t for q, t in timings.items()},
+            })
+        return baseline, sorted(results, key=lambda r: r["workload_gain_pct"], reverse=True)
+
+    def select_best_set(self, baseline, ranked):
+        """Greedily add candidates in order of individual gain while the combined workload keeps improving"""
+        chosen = []
+        best_total = sum(baseline.values())
+        for result in ranked:
+            if result["workload_gain_pct"] <= 100 * self.min_gain:
+                break
+            trial = chosen + [result["index"]]
+            self.create_indexes(trial)
+            try:
+                timings, _ = self.benchmark_workload("+".join(trial))
+            finally:
+                self.drop_indexes(trial)
+            total = sum(timings.values())
+            if total < best_total * (1 - self.min_gain):
+                chosen, best_total = trial, total
+        return chosen, best_total
+
+    def measure_write_cost(self, index_sets, rows=200_000, seed=42):
+        """COPY the same synthetic events into a scratch table under each index set
+
+        Uses the analyzer's warmup/repetition protocol: the table is emptied before every load,
+        and the median load time is reported.
+        """
+        self.cur.execute("SELECT COUNT(*) FROM users")
+        num_users = max(self.cur.fetchone()[0], 1)
+        self.cur.execute("SELECT COUNT(*) FROM products")
+        num_products = max(self.cur.fetchone()[0], 1)
+        # Drawn once up front, so only the COPY itself is timed
+        frames = list(generate_events(seed, plan_event_chunks(rows), num_users, num_products,
+                                      30, datetime.now()))
+
+        results = []
+        for label, names in index_sets.items():
+            self._execute(f"DROP TABLE IF EXISTS {PROBE_TABLE}")
+            # Same columns and existing indexes as events, with its own id sequence
+            self._execute(f"CREATE TABLE {PROBE_TABLE} (LIKE events INCLUDING INDEXES)")
+            self._execute(f"ALTER TABLE {PROBE_TABLE} ALTER COLUMN event_id ADD GENERATED BY DEFAULT AS IDENTITY")
+            self.create_indexes(names, table=PROBE_TABLE)
+            timings = []
+            for run in range(self.analyzer.warmup + self.analyzer.repetitions):
+                self._execute(f"TRUNCATE {PROBE_TABLE} RESTART IDENTITY")
+                start_time = time.perf_counter()
+                copy_rows(self.cur, PROBE_TABLE, EVENT_COLUMNS, frames)
+                self.conn.commit()
+                if run >= self.analyzer.warmup:
+                    timings.append(time.perf_counter() - start_time)
+            stats = summarize_timings(timings)
+            results.append({"index_set": label, "rows_per_s": rows / stats["median"], "load_s": stats["median"],
+                            "load_stddev_s": stats["stddev"], "runs": stats["runs"]})
+        self._execute(f"DROP TABLE IF EXISTS {PROBE_TABLE}")
+
+        base = results[0]["load_s"]
+        for result in results:
+            result["write_amplification"] = result["load_s"] / base
+        return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Propose and A/B benchmark indexes for the analysis queries")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs before each query or probe load")
+    parser.add_argument("--repetitions", type=positive_int, default=5,
+                        help="timed runs per query and per probe load")
+    parser.add_argument("--min-gain", type=float, default=0.02,
+                        help="relative workload improvement needed to keep an index")
+    parser.add_argument("--probe-rows", type=int, default=200_000,
+                        help="events bulk-loaded to measure write amplification")
+    parser.add_argument("--output", default=None, help="append results to this .json or .csv file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    analyzer = QueryAnalyzer(warmup=args.warmup, repetitions=args.repetitions)
+    advisor = IndexAdvisor(analyzer, min_gain=args.min_gain)
+
+    baseline, ranked = advisor.evaluate_candidates()
+    print("\n=== Candidate Indexes (each alone vs baseline) ===")
+    print(tabulate(pd.DataFrame(ranked), headers='keys', tablefmt='pipe', floatfmt='.4f', showindex=False))
+
+    chosen, best_total = advisor.select_best_set(baseline, ranked)
+    baseline_total = sum(baseline.values())
+    print(f"\nRecommended index set: {', '.join(chosen) or '(none)'}")
+    print(f"Workload time: {baseline_total:.4f}s -> {best_total:.4f}s "
+          f"({100 * (1 - best_total / baseline_total):.2f}% faster)")
+
+    index_sets = {"no extra indexes": [], **{name: [name] for name in chosen}}
+    if len(chosen) > 1:
+        index_sets["recommended set"] = chosen
+    write_costs = advisor.measure_write_cost(index_sets, rows=args.probe_rows)
+    print("\n=== Bulk Loader Write Amplification ===")
+    print(tabulate(pd.DataFrame(write_costs), headers='keys', tablefmt='pipe', floatfmt='.2f', showindex=False))
+
+    if args.output:
+        save_results(ranked, args.output)
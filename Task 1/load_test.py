@@ -0,0 +1,157 @@
+import argparse
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import pandas as pd
+from tabulate import tabulate
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from analysis import (REVENUE_BASIC_QUERY, REVENUE_OPTIMIZED_QUERY, WAU_BASIC_QUERY,
+                      WAU_OPTIMIZED_QUERY)
+from benchmarking import percentile, save_results
+from common.db import ensure_pool_size, get_connection, release_connection
+from rollups import REVENUE_ROLLUP_QUERY, WAU_ROLLUP_QUERY
+
+QUERIES = {
+    "wau_basic": WAU_BASIC_QUERY,
+    "wau_optimized": WAU_OPTIMIZED_QUERY,
+    "wau_rollup": WAU_ROLLUP_QUERY,
+    "revenue_basic": REVENUE_BASIC_QUERY,
+    "revenue_optimized": REVENUE_OPTIMIZED_QUERY,
+    "revenue_rollup": REVENUE_ROLLUP_QUERY,
+}
+
+# Dashboards mostly hit the optimized queries
+DEFAULT_MIX = {"wau_optimized": 4, "revenue_optimized": 4, "wau_basic": 1, "revenue_basic": 1}
+
+
+def parse_mix(text):
+    """Parse 'name=weight,name=weight' into a weight dict"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in QUERIES:
+            raise ValueError(f"unknown query '{name}', choose from {', '.join(QUERIES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def client_loop(client_id, mix, deadline, measure_from, seed, latencies, errors, failures, lock):
+    """One simulated dashboard: replay weighted random queries until the deadline
+
+    A client that cannot get a connection stops and records why in `failures`.
+    """
+    rng = random.Random(seed + client_id)
+    names = list(mix)
+    weights = list(mix.values())
+    conn = None
+    try:
+        conn = get_connection()
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start_time = time.perf_counter()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(QUERIES[name])
+                    cur.fetchall()
+                conn.rollback()
+                failed = None
+            except Exception as e:
+                failed = f"{type(e).__name__}: {e}".strip()
+                # The connection may be broken; swap it for a fresh one from the pool
+                release_connection(conn)
+                conn = None
+                conn = get_connection()
+            finished = time.perf_counter()
+            if start_time < measure_from:
+                continue
+            with lock:
+                if failed:
+                    errors[name].append(failed)
+                else:
+                    latencies[name].append(finished - start_time)
+    except Exception as e:
+        with lock:
+            failures.append(f"client {client_id}: {type(e).__name__}: {e}".strip())
+    finally:
+        if conn is not None:
+            release_connection(conn)
+
+
+def run_load_test(clients=10, duration=30.0, mix=None, warmup=5.0, seed=42):
+    """Run concurrent clients for a fixed duration and summarize throughput and latency per query"""
+    mix = mix or DEFAULT_MIX
+    # Each client holds one pooled connection for the whole run
+    ensure_pool_size(clients)
+
+    latencies = defaultdict(list)
+    errors = defaultdict(list)
+    failures = []
+    lock = threading.Lock()
+    start_time = time.perf_counter()
+    measure_from = start_time + warmup
+    deadline = measure_from + duration
+
+    threads = [
+        threading.Thread(target=client_loop,
+                         args=(i, mix, deadline, measure_from, seed, latencies, errors, failures, lock))
+        for i in range(clients)
+    ]
+    print(f"Running {clients} clients for {duration:.0f}s (+{warmup:.0f}s warmup)...")
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = max(time.perf_counter() - measure_from, 1e-9)
+
+    rows = []
+    for name in mix:
+        timings = latencies.get(name, [])
+        rows.append({
+            "name": name,
+            "mode": f"load(clients={clients})",
+            "failed_clients": len(failures),
+            "completed": len(timings),
+            "errors": len(errors.get(name, [])),
+            "throughput_qps": len(timings) / elapsed,
+            "p50": percentile(timings, 50),
+            "p95": percentile(timings, 95),
+            "p99": percentile(timings, 99),
+            "max": max(timings) if timings else float("nan"),
+        })
+    for name, messages in errors.items():
+        print(f"{name}: {len(messages)} errors, first: {messages[0]}")
+    if failures:
+        print(f"Warning: {len(failures)} of {clients} clients stopped early, first: {failures[0]}")
+    return rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the Task 1 analysis queries")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent simulated dashboards")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the run")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help=f"weighted query mix, e.g. wau_optimized=4,revenue_basic=1 "
+                             f"(queries: {', '.join(QUERIES)})")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the per-client query choice")
+    parser.add_argument("--output", default=None, help="append results to this .json or .csv file")
+    parser.add_argument("--release", default=None, help="release label stored with the results")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run_load_test(args.clients, args.duration, args.mix, args.warmup, args.seed)
+
+    print("\n=== Load Test Report ===")
+    print(tabulate(pd.DataFrame(results), headers='keys', tablefmt='pipe', floatfmt='.4f', showindex=False))
+    total = sum(r["throughput_qps"] for r in results)
+    print(f"\nTotal throughput: {total:.2f} queries/s, "
+          f"errors: {sum(r['errors'] for r in results)}")
+    if args.output:
+        save_results(results, args.output, release=args.release)
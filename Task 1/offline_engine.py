@@ -0,0 +1,78 @@
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+try:
+    import duckdb
+except ImportError:  # DuckDB is optional, the pandas/pyarrow engine needs nothing extra
+    duckdb = None
+
+
+class OfflineEngine:
+    """Runs the WAU and revenue analyses over the Parquet export instead of live PostgreSQL"""
+
+    def __init__(self, data_dir="parquet", engine="duckdb"):
+        if engine == "duckdb" and duckdb is None:
+            raise ImportError("engine='duckdb' needs the duckdb package (pip install duckdb)")
+        self.data_dir = data_dir
+        self.engine = engine
+        self.events_path = os.path.join(data_dir, "events")
+        self.products_path = os.path.join(data_dir, "products")
+        if engine == "duckdb":
+            self.db = duckdb.connect()
+
+    def _events_glob(self):
+        return os.path.join(self.events_path, "**", "*.parquet")
+
+    def weekly_active_users(self, days=None):
+        """[(week, active_users)], optionally limited to the last `days` days"""
+        since = datetime.combine(date.today() - timedelta(days=days), datetime.min.time()) if days else None
+        if self.engine == "duckdb":
+            where = "WHERE timestamp >= ?" if since else ""
+            return self.db.execute(f"""
+            SELECT DATE_TRUNC('week', timestamp) AS week, COUNT(DISTINCT user_id) AS active_users
+            FROM read_parquet('{self._events_glob()}', hive_partitioning = true)
+            {where}
+            GROUP BY week
+            ORDER BY week
+            """, [since] if since else []).fetchall()
+
+        dataset = ds.dataset(self.events_path, format="parquet", partitioning="hive")
+        expression = None
+        if since:
+            # The month partition filter skips whole directories, the timestamp filter trims the edge
+            expression = ((ds.field("month") >= since.strftime("%Y-%m"))
+                          & (ds.field("timestamp") >= pd.Timestamp(since)))
+        frame = dataset.to_table(columns=["user_id", "timestamp"], filter=expression).to_pandas()
+        weeks = frame["timestamp"].dt.to_period("W-SUN").dt.start_time
+        counts = frame.groupby(weeks)["user_id"].nunique().sort_index()
+        return list(counts.items())
+
+    def revenue_per_category(self):
+        """[(category, total_revenue)] ordered by revenue"""
+        if self.engine == "duckdb":
+            products_glob = os.path.join(self.products_path, "*.parquet")
+            return self.db.execute(f"""
+            SELECT p.category, SUM(p.price * e.purchase_count) AS total_revenue
+            FROM read_parquet('{products_glob}') p
+            JOIN (
+                SELECT product_id, COUNT(*) AS purchase_count
+                FROM read_parquet('{self._events_glob()}', hive_partitioning = true)
+                WHERE event_type = 'purchased'
+                GROUP BY product_id
+            ) e ON p.product_id = e.product_id
+            GROUP BY p.category
+            ORDER BY total_revenue DESC
+            """).fetchall()
+
+        events = ds.dataset(self.events_path, format="parquet", partitioning="hive")
+        purchases = events.to_table(columns=["product_id"],
+                                    filter=ds.field("event_type") == "purchased").to_pandas()
+        products = ds.dataset(self.products_path, format="parquet").to_table(
+            columns=["product_id", "category", "price"]).to_pandas()
+        counts = purchases["product_id"].value_counts().rename("purchase_count")
+        joined = products.join(counts, on="product_id", how="inner")
+        revenue = (joined["price"] * joined["purchase_count"]).groupby(joined["category"]).sum()
+        return list(revenue.sort_values(ascending=False).items())
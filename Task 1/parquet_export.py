@@ -0,0 +1,84 @@
+import argparse
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import get_connection, release_connection
+
+EXPORTS = {
+    "users": ("SELECT user_id, signup_date, country FROM users",
+              ["user_id", "signup_date", "country"]),
+    "products": ("SELECT product_id, category, price::float8 FROM products",
+                 ["product_id", "category", "price"]),
+    "events": ("SELECT event_id, user_id, event_type, product_id, timestamp FROM events",
+               ["event_id", "user_id", "event_type", "product_id", "timestamp"]),
+}
+
+
+def export_table(conn, table, out_dir, chunk_rows=1_000_000):
+    """Stream a table through a server-side cursor into Parquet files, one chunk at a time
+
+    events is hive-partitioned by month (events/month=YYYY-MM/...) so readers can skip
+    whole months when they filter on time.
+    """
+    query, columns = EXPORTS[table]
+    target = os.path.join(out_dir, table)
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.makedirs(target)
+
+    rows = 0
+    start_time = time.perf_counter()
+    with conn.cursor(name=f"parquet_export_{table}") as cur:
+        cur.itersize = chunk_rows
+        cur.execute(query)
+        chunk_index = 0
+        while True:
+            batch = cur.fetchmany(chunk_rows)
+            if not batch:
+                break
+            frame = pd.DataFrame(batch, columns=columns)
+            if table == "events":
+                frame["month"] = frame["timestamp"].dt.strftime("%Y-%m")
+                pq.write_to_dataset(
+                    pa.Table.from_pandas(frame, preserve_index=False), target,
+                    partition_cols=["month"],
+                    basename_template=f"part-{chunk_index:05d}-{{i}}.parquet"
+                )
+            else:
+                pq.write_table(pa.Table.from_pandas(frame, preserve_index=False),
+                               os.path.join(target, f"part-{chunk_index:05d}.parquet"))
+            rows += len(frame)
+            chunk_index += 1
+    conn.rollback()
+
+    elapsed = time.perf_counter() - start_time
+    rate = rows / elapsed if elapsed > 0 else float("inf")
+    print(f"Exported {rows:,} rows from {table} to {target} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export events, users and products to Parquet")
+    parser.add_argument("--out-dir", default="parquet", help="root directory of the export")
+    parser.add_argument("--chunk-rows", type=int, default=1_000_000,
+                        help="rows fetched and written per Parquet file")
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORTS), default=list(EXPORTS))
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    conn = get_connection()
+    try:
+        for table in args.tables:
+            export_table(conn, table, args.out_dir, args.chunk_rows)
+    finally:
+        release_connection(conn)
@@ -0,0 +1,148 @@
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import psycopg2
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import get_connection, release_connection
+
+PARTITIONED_TABLE = "events_partitioned"
+
+# Same analyses as QueryAnalyzer, parameterized by table so flat and partitioned layouts can be compared
+WAU_QUERY = """
+SELECT
+    DATE_TRUNC('week', timestamp) as week,
+    COUNT(DISTINCT user_id) as active_users
+FROM {table}
+WHERE timestamp >= CURRENT_DATE - INTERVAL '90 days'
+GROUP BY DATE_TRUNC('week', timestamp)
+ORDER BY week;
+"""
+
+REVENUE_QUERY = """
+SELECT
+    p.category,
+    SUM(p.price * event_counts.purchase_count) as total_revenue
+FROM products p
+JOIN (
+    SELECT product_id, COUNT(*) as purchase_count
+    FROM {table}
+    WHERE event_type = 'purchased'
+      AND timestamp >= CURRENT_DATE - INTERVAL '90 days'
+    GROUP BY product_id
+) event_counts ON p.product_id = event_counts.product_id
+GROUP BY p.category
+ORDER BY total_revenue DESC;
+"""
+
+
+def period_start(moment, interval):
+    """Start of the week (Monday) or month containing moment"""
+    day = datetime(moment.year, moment.month, moment.day)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(start, interval):
+    if interval == "week":
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def is_partitioned(cur, table):
+    cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", (table,))
+    return cur.fetchone() is not None
+
+
+def create_partitioned_table(cur, table=PARTITIONED_TABLE):
+    """Create an events table range-partitioned on timestamp, with a default partition"""
+    cur.execute(f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        event_id INTEGER NOT NULL DEFAULT nextval('events_event_id_seq'),
+        user_id INTEGER REFERENCES users(user_id),
+        event_type VARCHAR(20),
+        product_id INTEGER REFERENCES products(product_id),
+        timestamp TIMESTAMP NOT NULL,
+        PRIMARY KEY (event_id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+    """)
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    # Indexes created on the parent cascade to every partition
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_type_timestamp_idx ON {table}(event_type, timestamp)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_user_timestamp_idx ON {table}(user_id, timestamp)")
+
+
+def ensure_partitions(cur, table, start, end, interval="month"):
+    """Create any missing week/month partitions covering [start, end]"""
+    if not is_partitioned(cur, table):
+        raise ValueError(f"{table} is not a partitioned table, run 'partitioning.py migrate' first")
+    created = 0
+    lower = period_start(start, interval)
+    while lower <= end:
+        upper = next_period(lower, interval)
+        name = f"{table}_p{lower:%Y%m%d}"
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is None:
+            cur.execute(
+                f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+                (lower, upper)
+            )
+            created += 1
+        lower = upper
+    return created
+
+
+def migrate(conn, interval="month", table=PARTITIONED_TABLE, swap=False):
+    """Copy the flat events table into a partitioned copy, optionally swapping it in as events"""
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM events")
+    start, end, rows = cur.fetchone()
+    if rows == 0:
+        print("events is empty, nothing to migrate")
+        return
+
+    start_time = time.perf_counter()
+    create_partitioned_table(cur, table)
+    created = ensure_partitions(cur, table, start, end, interval)
+    cur.execute(f"TRUNCATE {table}")
+    cur.execute(f"""
+    INSERT INTO {table} (event_id, user_id, event_type, product_id, timestamp)
+    SELECT event_id, user_id, event_type, product_id, timestamp FROM events
+    """)
+    cur.execute(f"ANALYZE {table}")
+    print(f"Copied {rows:,} events into {table} ({created} new {interval}ly partitions) "
+          f"in {time.perf_counter() - start_time:.2f}s")
+
+    if swap:
+        cur.execute("ALTER TABLE events RENAME TO events_flat")
+        cur.execute(f"ALTER TABLE {table} RENAME TO events")
+        print("Swapped tables: events is now partitioned, the flat table is events_flat")
+    conn.commit()
+    cur.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Range-partition the events table by week or month")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("--interval", choices=["week", "month"], default="month")
+    parser.add_argument("--table", default=PARTITIONED_TABLE,
+                        help="name of the partitioned copy of events")
+    parser.add_argument("--swap", action="store_true",
+                        help="rename events to events_flat and the partitioned copy to events")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    conn = get_connection()
+    try:
+        migrate(conn, args.interval, args.table, args.swap)
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"An error occurred: {e}")
+    finally:
+        release_connection(conn)
@@ -0,0 +1,144 @@
+import difflib
+import json
+from collections import Counter
+
+
+def explain_analyze(cur, query):
+    """Run EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and return the top-level plan dict"""
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query.strip().rstrip(";"))
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def _walk(node, depth=0):
+    yield node, depth
+    for child in node.get("Plans", []):
+        yield from _walk(child, depth + 1)
+
+
+def _child_processes(node, processes):
+    """Processes sharing the work of node's children: a Gather's workers plus its leader"""
+    if node["Node Type"] in ("Gather", "Gather Merge"):
+        return node.get("Workers Launched", 0) + 1
+    return processes
+
+
+def _loop_total(node, key, processes):
+    """Value summed over a node's loops; times are divided by the processes that ran them at once"""
+    value = node.get(key, 0)
+    if key == "Actual Total Time":
+        value *= node.get("Actual Loops", 1) / processes
+    return value
+
+
+def _node_label(node):
+    label = node["Node Type"]
+    if "Relation Name" in node:
+        label += f" on {node['Relation Name']}"
+    if "Index Name" in node:
+        label += f" using {node['Index Name']}"
+    return label
+
+
+def _exclusive(node, key, processes=1):
+    """Per-node value with the children's inclusive share removed
+
+    Below a Gather, loops of the parallel workers run concurrently, so their times are spread
+    over the processes instead of added up.
+    """
+    total = _loop_total(node, key, processes)
+    child_processes = _child_processes(node, processes)
+    for child in node.get("Plans", []):
+        total -= _loop_total(child, key, child_processes)
+    return max(total, 0)
+
+
+def summarize_plan(explain):
+    """Buffer hits/reads, rows scanned, node types and where time is spent for one plan"""
+    root = explain["Plan"]
+    nodes = []
+    node_types = Counter()
+    rows_scanned = 0
+    processes = {id(root): 1}
+    for node, depth in _walk(root):
+        node_processes = processes[id(node)]
+        for child in node.get("Plans", []):
+            processes[id(child)] = _child_processes(node, node_processes)
+        node_types[node["Node Type"]] += 1
+        loops = node.get("Actual Loops", 1)
+        rows = node.get("Actual Rows", 0) * loops
+        if "Scan" in node["Node Type"]:
+            # Like Actual Rows, rows removed by a filter are reported per loop
+            rows_scanned += rows + node.get("Rows Removed by Filter", 0) * loops
+        nodes.append({
+            "depth": depth,
+            "node": _node_label(node),
+            "rows": rows,
+            "self_time_ms": _exclusive(node, "Actual Total Time", node_processes),
+            "shared_hit": _exclusive(node, "Shared Hit Blocks"),
+            "shared_read": _exclusive(node, "Shared Read Blocks"),
+        })
+
+    return {
+        "planning_time_ms": explain.get("Planning Time", 0.0),
+        "execution_time_ms": explain.get("Execution Time", 0.0),
+        "shared_hit": root.get("Shared Hit Blocks", 0),
+        "shared_read": root.get("Shared Read Blocks", 0),
+        "rows_scanned": rows_scanned,
+        "node_types": dict(node_types),
+        "hotspots": sorted(nodes, key=lambda n: n["self_time_ms"], reverse=True)[:5],
+        "nodes": nodes,
+    }
+
+
+def partition_scan_stats(explain, table):
+    """Partitions of table actually scanned, and subplans removed by pruning at executor startup"""
+    scanned = set()
+    removed = 0
+    for node, _ in _walk(explain["Plan"]):
+        removed += node.get("Subplans Removed", 0)
+        relation = node.get("Relation Name", "")
+        if "Scan" in node["Node Type"] and relation.startswith(table + "_"):
+            scanned.add(relation)
+    return {"partitions_scanned": len(scanned), "subplans_removed": removed}
+
+
+def plan_outline(explain):
+    """Indented node-per-line outline of a plan, used for structural diffs"""
+    return ["  " * depth + _node_label(node) for node, depth in _walk(explain["Plan"])]
+
+
+def diff_plans(basic, optimized):
+    """Structural diff between two plans plus the change in the headline metrics"""
+    basic_summary = summarize_plan(basic)
+    optimized_summary = summarize_plan(optimized)
+    structure = list(difflib.unified_diff(
+        plan_outline(basic), plan_outline(optimized),
+        fromfile="basic", tofile="optimized", lineterm="", n=100
+    ))
+    metrics = {
+        key: (basic_summary[key], optimized_summary[key])
+        for key in ("execution_time_ms", "shared_hit", "shared_read", "rows_scanned")
+    }
+    return {"structure": structure, "metrics": metrics,
+            "basic": basic_summary, "optimized": optimized_summary}
+
+
+def format_plan_diff(name, diff):
+    """Human-readable block for the performance report"""
+    lines = [f"\n--- Plan comparison: {name} ---"]
+    for key, (before, after) in diff["metrics"].items():
+        lines.append(f"{key:>18}: {before:>12,.2f} -> {after:>12,.2f}")
+    for label in ("basic", "optimized"):
+        hotspots = ", ".join(
+            f"{n['node']} ({n['self_time_ms']:.2f} ms)" for n in diff[label]["hotspots"][:3]
+        )
+        lines.append(f"{label} time spent in: {hotspots}")
+    if diff["structure"]:
+        lines.append("Plan structure diff:")
+        lines.extend(diff["structure"])
+    else:
+        lines.append("Plan structure unchanged")
+    return "\n".join(lines)
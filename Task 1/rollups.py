@@ -0,0 +1,246 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import psycopg2
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import EVENT_LOAD_LOCK, get_connection, release_connection
+from hll import HyperLogLog
+
+ROLLUP_TABLES = """
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name TEXT PRIMARY KEY,
+    last_event_id BIGINT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP
+);
+-- One row per (week, active user): lets new events be de-duplicated against what is already counted
+CREATE TABLE IF NOT EXISTS weekly_user_activity (
+    week DATE NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (week, user_id)
+);
+CREATE TABLE IF NOT EXISTS weekly_active_users (
+    week DATE PRIMARY KEY,
+    active_users INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS weekly_category_revenue (
+    week DATE NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    purchases BIGINT NOT NULL,
+    revenue NUMERIC(16,2) NOT NULL,
+    PRIMARY KEY (week, category)
+);
+-- HyperLogLog registers of the users active each week, for approximate WAU
+CREATE TABLE IF NOT EXISTS wau_sketches (
+    week DATE PRIMARY KEY,
+    precision SMALLINT NOT NULL,
+    registers BYTEA NOT NULL
+);
+INSERT INTO rollup_watermarks (name) VALUES ('weekly_rollups'), ('wau_sketches') ON CONFLICT DO NOTHING;
+"""
+
+# Only the unseen (week, user) pairs are inserted, and only those bump the weekly counters
+REFRESH_WAU = """
+WITH new_pairs AS (
+    INSERT INTO weekly_user_activity (week, user_id)
+    SELECT DISTINCT DATE_TRUNC('week', timestamp)::date, user_id
+    FROM events
+    WHERE event_id > %(low)s AND event_id <= %(high)s AND user_id IS NOT NULL
+    ON CONFLICT DO NOTHING
+    RETURNING week
+)
+INSERT INTO weekly_active_users (week, active_users)
+SELECT week, COUNT(*) FROM new_pairs GROUP BY week
+ON CONFLICT (week) DO UPDATE
+SET active_users = weekly_active_users.active_users + EXCLUDED.active_users;
+"""
+
+# Revenue is booked at the product price current at refresh time
+REFRESH_REVENUE = """
+INSERT INTO weekly_category_revenue (week, category, purchases, revenue)
+SELECT
+    DATE_TRUNC('week', e.timestamp)::date,
+    p.category,
+    COUNT(*),
+    SUM(p.price)
+FROM events e
+JOIN products p ON e.product_id = p.product_id
+WHERE e.event_type = 'purchased' AND e.event_id > %(low)s AND e.event_id <= %(high)s
+GROUP BY 1, 2
+ON CONFLICT (week, category) DO UPDATE
+SET purchases = weekly_category_revenue.purchases + EXCLUDED.purchases,
+    revenue = weekly_category_revenue.revenue + EXCLUDED.revenue;
+"""
+
+WAU_ROLLUP_QUERY = """
+SELECT week, active_users
+FROM weekly_active_users
+ORDER BY week;
+"""
+
+REVENUE_ROLLUP_QUERY = """
+SELECT category, SUM(revenue) as total_revenue
+FROM weekly_category_revenue
+GROUP BY category
+ORDER BY total_revenue DESC;
+"""
+
+
+def create_rollup_tables(cur):
+    cur.execute(ROLLUP_TABLES)
+
+
+def reset_rollups(cur):
+    """Empty every rollup and sketch and zero both watermarks, for when events is reloaded"""
+    create_rollup_tables(cur)
+    cur.execute("TRUNCATE weekly_user_activity, weekly_active_users, weekly_category_revenue, wau_sketches")
+    cur.execute("UPDATE rollup_watermarks SET last_event_id = 0")
+
+
+def _refresh_bounds(cur, name):
+    """(watermark, newest event_id) for a refresh, taken once no event load is in progress
+
+    Parallel loads commit their event ids out of order, so the refresh waits on the load lock
+    rather than folding in a range that may still gain rows.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (EVENT_LOAD_LOCK,))
+    # Row lock serializes concurrent refreshes
+    cur.execute("SELECT last_event_id FROM rollup_watermarks WHERE name = %s FOR UPDATE", (name,))
+    low = cur.fetchone()[0]
+    cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM events")
+    return low, cur.fetchone()[0]
+
+
+def refresh_rollups(conn):
+    """Fold events newer than the stored watermark into the weekly rollup tables"""
+    start_time = time.perf_counter()
+    with conn.cursor() as cur:
+        create_rollup_tables(cur)
+        low, high = _refresh_bounds(cur, "weekly_rollups")
+        if high < low:
+            print(f"Newest event is {high:,} but rollups reached {low:,}: events was reloaded, rebuilding")
+            return rebuild_rollups(conn)
+        if high == low:
+            conn.commit()
+            print("Rollups already up to date")
+            return 0
+
+        bounds = {"low": low, "high": high}
+        cur.execute(REFRESH_WAU, bounds)
+        cur.execute(REFRESH_REVENUE, bounds)
+        cur.execute(
+            "UPDATE rollup_watermarks SET last_event_id = %s, refreshed_at = NOW() WHERE name = 'weekly_rollups'",
+            (high,)
+        )
+    conn.commit()
+    print(f"Folded events {low + 1:,}..{high:,} into rollups in {time.perf_counter() - start_time:.2f}s")
+    return high - low
+
+
+def rebuild_rollups(conn):
+    """Empty the rollups and reset the watermark, then refresh from the first event"""
+    with conn.cursor() as cur:
+        create_rollup_tables(cur)
+        cur.execute("TRUNCATE weekly_user_activity, weekly_active_users, weekly_category_revenue")
+        cur.execute("UPDATE rollup_watermarks SET last_event_id = 0 WHERE name = 'weekly_rollups'")
+    return refresh_rollups(conn)
+
+
+def load_wau_sketches(cur):
+    """Read the stored per-week sketches as {week: HyperLogLog}"""
+    cur.execute("SELECT week, precision, registers FROM wau_sketches ORDER BY week")
+    return {week: HyperLogLog.from_bytes(bytes(registers), precision)
+            for week, precision, registers in cur.fetchall()}
+
+
+def refresh_wau_sketches(conn, precision=14, batch_size=500_000):
+    """Stream events past the sketch watermark and fold their user ids into per-week sketches"""
+    start_time = time.perf_counter()
+    with conn.cursor() as cur:
+        create_rollup_tables(cur)
+        low, high = _refresh_bounds(cur, "wau_sketches")
+        if high < low:
+            print(f"Newest event is {high:,} but sketches reached {low:,}: events was reloaded, rebuilding")
+            return rebuild_wau_sketches(conn, precision)
+        if high == low:
+            conn.commit()
+            print("WAU sketches already up to date")
+            return 0
+
+        sketches = load_wau_sketches(cur)
+        for sketch in sketches.values():
+            if sketch.precision != precision:
+                raise ValueError("stored sketches use a different precision, rebuild them first")
+
+    with conn.cursor(name="wau_sketch_stream") as stream:
+        stream.itersize = batch_size
+        stream.execute("""
+        SELECT DATE_TRUNC('week', timestamp)::date, user_id
+        FROM events
+        WHERE event_id > %s AND event_id <= %s AND user_id IS NOT NULL
+        """, (low, high))
+        while True:
+            batch = stream.fetchmany(batch_size)
+            if not batch:
+                break
+            weeks = np.array([row[0] for row in batch], dtype="datetime64[D]")
+            user_ids = np.array([row[1] for row in batch], dtype=np.int64)
+            for week in np.unique(weeks):
+                key = week.astype(object)
+                sketches.setdefault(key, HyperLogLog(precision)).add(user_ids[weeks == week])
+
+    with conn.cursor() as cur:
+        for week, sketch in sketches.items():
+            cur.execute("""
+            INSERT INTO wau_sketches (week, precision, registers) VALUES (%s, %s, %s)
+            ON CONFLICT (week) DO UPDATE SET precision = EXCLUDED.precision, registers = EXCLUDED.registers
+            """, (week, precision, psycopg2.Binary(sketch.to_bytes())))
+        cur.execute(
+            "UPDATE rollup_watermarks SET last_event_id = %s, refreshed_at = NOW() WHERE name = 'wau_sketches'",
+            (high,)
+        )
+    conn.commit()
+    print(f"Folded events {low + 1:,}..{high:,} into {len(sketches)} weekly sketches "
+          f"in {time.perf_counter() - start_time:.2f}s")
+    return high - low
+
+
+def rebuild_wau_sketches(conn, precision=14):
+    with conn.cursor() as cur:
+        create_rollup_tables(cur)
+        cur.execute("TRUNCATE wau_sketches")
+        cur.execute("UPDATE rollup_watermarks SET last_event_id = 0 WHERE name = 'wau_sketches'")
+    return refresh_wau_sketches(conn, precision)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Maintain weekly WAU and revenue rollup tables")
+    parser.add_argument("command", choices=["refresh", "rebuild"],
+                        help="refresh: fold in new events only, rebuild: recompute from scratch")
+    parser.add_argument("--sketches", action="store_true",
+                        help="also maintain the per-week HyperLogLog sketches for approximate WAU")
+    parser.add_argument("--precision", type=int, default=14,
+                        help="HyperLogLog precision p (2^p registers, error about 1.04/sqrt(2^p))")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    conn = get_connection()
+    try:
+        if args.command == "rebuild":
+            rebuild_rollups(conn)
+            if args.sketches:
+                rebuild_wau_sketches(conn, args.precision)
+        else:
+            refresh_rollups(conn)
+            if args.sketches:
+                refresh_wau_sketches(conn, args.precision)
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"An error occurred: {e}")
+    finally:
+        release_connection(conn)
@@ -0,0 +1,182 @@
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import get_connection, release_connection
+
+GRAPHS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "graphs")
+
+
+def stream_weekly_active_users(conn, batch_size=200_000):
+    """Yield (week_start, user_ids) for every week from the first to the last, oldest first
+
+    One pass over `events` through a server-side cursor ordered by week; week groups are cut on
+    the client, so only one week of distinct user ids is held in memory at a time. Weeks
+    without events are yielded with an empty array.
+    """
+    with conn.cursor(name="cohort_week_stream") as cur:
+        cur.itersize = batch_size
+        cur.execute("""
+        SELECT DISTINCT DATE_TRUNC('week', timestamp)::date AS week, user_id
+        FROM events
+        WHERE user_id IS NOT NULL
+        ORDER BY week
+        """)
+        week, chunks = None, []
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            weeks = np.array([row[0] for row in batch], dtype="datetime64[D]")
+            user_ids = np.fromiter((row[1] for row in batch), dtype=np.int64, count=len(batch))
+            # Rows are sorted by week, so each batch splits into contiguous week runs
+            bounds = np.flatnonzero(weeks[1:] != weeks[:-1]) + 1
+            for run_weeks, run_users in zip(np.split(weeks, bounds), np.split(user_ids, bounds)):
+                run_week = run_weeks[0].item()
+                if week is not None and run_week != week:
+                    yield week, np.concatenate(chunks)
+                    week += timedelta(days=7)
+                    while week < run_week:
+                        yield week, np.empty(0, dtype=np.int64)
+                        week += timedelta(days=7)
+                    chunks = []
+                week = run_week
+                chunks.append(run_users)
+        if week is not None:
+            yield week, np.concatenate(chunks)
+    conn.rollback()
+
+
+def build_retention_matrix(weekly_users, n_weeks=8, kind="classic"):
+    """Fill the cohort x week-offset matrix from a stream of (week_start, user_ids)
+
+    Per user only the first and last active week index are kept (two int32 arrays indexed by
+    user_id), and each week is folded in with array operations, so memory is bounded by the
+    number of users, not events.
+    classic: a user counts in offset k if active exactly k weeks after their first week.
+    rolling: a user counts in offset k if active k or more weeks later (never increases).
+    """
+    first_week = np.full(1024, -1, dtype=np.int32)
+    last_week = np.full(1024, -1, dtype=np.int32)
+    weeks = []
+    cohort_sizes = []
+    matrix = np.zeros((0, n_weeks), dtype=np.int64)
+
+    for week_index, (week, user_ids) in enumerate(weekly_users):
+        weeks.append(week)
+        matrix = np.vstack([matrix, np.zeros((1, n_weeks), dtype=np.int64)])
+        if user_ids.size == 0:
+            cohort_sizes.append(0)
+            continue
+        if user_ids.max() >= first_week.size:
+            grow = max(int(user_ids.max()) + 1, 2 * first_week.size) - first_week.size
+            first_week = np.concatenate([first_week, np.full(grow, -1, dtype=np.int32)])
+            last_week = np.concatenate([last_week, np.full(grow, -1, dtype=np.int32)])
+
+        new_users = user_ids[first_week[user_ids] == -1]
+        first_week[new_users] = week_index
+        last_week[user_ids] = week_index
+        cohort_sizes.append(new_users.size)
+
+        if kind == "classic":
+            # This week is offset (week_index - c) for cohort c, so each cohort fills exactly one cell
+            per_cohort = np.bincount(first_week[user_ids], minlength=week_index + 1)
+            cohorts = np.arange(max(0, week_index - n_weeks + 1), week_index + 1)
+            matrix[cohorts, week_index - cohorts] += per_cohort[cohorts]
+
+    if kind == "rolling" and weeks:
+        seen = first_week >= 0
+        cohorts = first_week[seen].astype(np.int64)
+        last_offset = np.minimum(last_week[seen] - first_week[seen], n_weeks - 1)
+        exact_last = np.bincount(cohorts * n_weeks + last_offset,
+                                 minlength=len(weeks) * n_weeks).reshape(len(weeks), n_weeks)
+        # Users whose last active offset is >= k, via a reverse cumulative sum
+        matrix = np.cumsum(exact_last[:, ::-1], axis=1)[:, ::-1]
+
+    # Offsets that lie beyond the last observed week are unknown, not zero
+    matrix = matrix.astype(float)
+    for cohort in range(len(weeks)):
+        matrix[cohort, len(weeks) - cohort:] = np.nan
+
+    columns = [f"Week {k}" for k in range(n_weeks)]
+    index = pd.Index([pd.Timestamp(w).date() for w in weeks], name="cohort_week")
+    counts_frame = pd.DataFrame(matrix, index=index, columns=columns)
+    sizes = pd.Series(cohort_sizes, index=index, name="cohort_size")
+    return counts_frame, sizes
+
+
+def retention_rates(counts, sizes):
+    """Retention percentage per cohort and week offset, dropping empty cohorts"""
+    nonempty = sizes > 0
+    return counts[nonempty].div(sizes[nonempty], axis=0) * 100
+
+
+def plot_heatmap(rates, path):
+    plt.figure(figsize=(12, max(4, 0.45 * len(rates))))
+    sns.heatmap(rates, annot=True, fmt=".1f", cmap="YlGnBu", vmin=0, vmax=100,
+                cbar_kws={"label": "Retention (%)"})
+    plt.title("Weekly Retention Rates by Cohort")
+    plt.xlabel("Weeks Since First Activity")
+    plt.ylabel("Cohort Week")
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close()
+
+
+def plot_lineplot(rates, path):
+    plt.figure(figsize=(12, 6))
+    for cohort, row in rates.iterrows():
+        plt.plot(range(len(row)), row.values, alpha=0.35, linewidth=1)
+    plt.plot(range(rates.shape[1]), rates.mean(axis=0).values, color="black", linewidth=3,
+             marker="o", label="Average")
+    plt.xticks(range(rates.shape[1]), rates.columns)
+    plt.title("Retention Trends Across Time")
+    plt.xlabel("Weeks Since First Activity")
+    plt.ylabel("Retention (%)")
+    plt.legend()
+    plt.grid(alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the weekly cohort retention matrix from events")
+    parser.add_argument("--weeks", type=int, default=8, help="week offsets tracked per cohort")
+    parser.add_argument("--kind", choices=["classic", "rolling"], default="rolling",
+                        help="classic: active in week k, rolling: active in week k or later")
+    parser.add_argument("--batch-size", type=int, default=200_000,
+                        help="user ids fetched per round trip")
+    parser.add_argument("--graphs-dir", default=GRAPHS_DIR, help="where heatmap.png and lineplot.png go")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    conn = get_connection()
+    try:
+        start_time = time.perf_counter()
+        counts, sizes = build_retention_matrix(
+            stream_weekly_active_users(conn, args.batch_size), args.weeks, args.kind
+        )
+        print(f"Built {len(counts)} x {args.weeks} retention matrix in {time.perf_counter() - start_time:.2f}s")
+    finally:
+        release_connection(conn)
+
+    rates = retention_rates(counts, sizes)
+    print(rates.round(1).to_string())
+    os.makedirs(args.graphs_dir, exist_ok=True)
+    plot_heatmap(rates, os.path.join(args.graphs_dir, "heatmap.png"))
+    plot_lineplot(rates, os.path.join(args.graphs_dir, "lineplot.png"))
+    print(f"Saved heatmap.png and lineplot.png to {args.graphs_dir}")
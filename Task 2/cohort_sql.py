@@ -0,0 +1,191 @@
+import argparse
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import get_connection, release_connection
+from cohort_retention import build_retention_matrix, stream_weekly_active_users
+
+# First-activity week via a window over each user's active weeks; only the compact
+# cohort x offset counts leave the server
+CLASSIC_QUERY = """
+WITH activity AS (
+    SELECT DISTINCT user_id, DATE_TRUNC('week', timestamp)::date AS week
+    FROM events
+    WHERE user_id IS NOT NULL
+), cohorts AS (
+    SELECT
+        week,
+        MIN(week) OVER (PARTITION BY user_id) AS cohort_week
+    FROM activity
+)
+SELECT cohort_week, (week - cohort_week) / 7 AS week_offset, COUNT(*) AS users
+FROM cohorts
+WHERE week - cohort_week < 7 * %(n_weeks)s
+GROUP BY cohort_week, week_offset
+ORDER BY cohort_week, week_offset;
+"""
+
+# Rolling retention: a user counts in offset k if still active k or more weeks later
+ROLLING_QUERY = """
+WITH activity AS (
+    SELECT DISTINCT user_id, DATE_TRUNC('week', timestamp)::date AS week
+    FROM events
+    WHERE user_id IS NOT NULL
+), spans AS (
+    SELECT DISTINCT
+        user_id,
+        MIN(week) OVER (PARTITION BY user_id) AS cohort_week,
+        MAX(week) OVER (PARTITION BY user_id) AS last_week
+    FROM activity
+)
+SELECT s.cohort_week, k.week_offset, COUNT(*) AS users
+FROM spans s
+JOIN generate_series(0, %(n_weeks)s - 1) AS k(week_offset)
+  ON (s.last_week - s.cohort_week) / 7 >= k.week_offset
+GROUP BY s.cohort_week, k.week_offset
+ORDER BY s.cohort_week, k.week_offset;
+"""
+
+MATERIALIZED_TABLE = """
+CREATE TABLE IF NOT EXISTS cohort_retention_matrix (
+    kind TEXT NOT NULL,
+    cohort_week DATE NOT NULL,
+    week_offset INTEGER NOT NULL,
+    users BIGINT NOT NULL,
+    as_of_week DATE NOT NULL,
+    computed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (kind, cohort_week, week_offset)
+);
+"""
+
+QUERIES = {"classic": CLASSIC_QUERY, "rolling": ROLLING_QUERY}
+
+
+def _last_week(cur):
+    cur.execute("SELECT MAX(DATE_TRUNC('week', timestamp))::date FROM events")
+    return cur.fetchone()[0]
+
+
+def to_matrix(rows, last_week, n_weeks=8):
+    """Pivot (cohort_week, week_offset, users) rows into the layout of build_retention_matrix"""
+    if not rows:
+        return pd.DataFrame(columns=[f"Week {k}" for k in range(n_weeks)]), pd.Series(dtype=int)
+    first_week = min(row[0] for row in rows)
+    n_total = (last_week - first_week).days // 7 + 1
+    matrix = np.zeros((n_total, n_weeks))
+    for cohort_week, week_offset, users in rows:
+        matrix[(cohort_week - first_week).days // 7, week_offset] = users
+    for cohort in range(n_total):
+        matrix[cohort, n_total - cohort:] = np.nan
+
+    index = pd.Index([first_week + timedelta(days=7 * i) for i in range(n_total)], name="cohort_week")
+    counts = pd.DataFrame(matrix, index=index, columns=[f"Week {k}" for k in range(n_weeks)])
+    sizes = counts["Week 0"].fillna(0).astype(int).rename("cohort_size")
+    return counts, sizes
+
+
+def compute_matrix(conn, n_weeks=8, kind="rolling"):
+    """Run the cohort query in PostgreSQL and return (counts, sizes)"""
+    with conn.cursor() as cur:
+        cur.execute(QUERIES[kind], {"n_weeks": n_weeks})
+        rows = cur.fetchall()
+        last_week = _last_week(cur)
+    conn.rollback()
+    return to_matrix(rows, last_week, n_weeks)
+
+
+def materialize_matrix(conn, n_weeks=8, kind="rolling"):
+    """Recompute the matrix server-side and replace the stored rows for this kind atomically
+
+    Every row records the newest event week of the snapshot, so reads need not touch events.
+    """
+    with conn.cursor() as cur:
+        cur.execute(MATERIALIZED_TABLE)
+        last_week = _last_week(cur)
+        cur.execute("DELETE FROM cohort_retention_matrix WHERE kind = %s", (kind,))
+        cur.execute(
+            "INSERT INTO cohort_retention_matrix (kind, cohort_week, week_offset, users, as_of_week) "
+            "SELECT %(kind)s, *, %(as_of_week)s FROM (" + QUERIES[kind].strip().rstrip(";") + ") AS matrix",
+            {"kind": kind, "n_weeks": n_weeks, "as_of_week": last_week}
+        )
+        rows = cur.rowcount
+    conn.commit()
+    return rows
+
+
+def read_materialized(conn, n_weeks=8, kind="rolling"):
+    """The stored snapshot, laid out up to the last week it was computed over"""
+    with conn.cursor() as cur:
+        cur.execute("""
+        SELECT cohort_week, week_offset, users, as_of_week
+        FROM cohort_retention_matrix
+        WHERE kind = %s AND week_offset < %s
+        ORDER BY cohort_week, week_offset
+        """, (kind, n_weeks))
+        rows = cur.fetchall()
+    conn.rollback()
+    last_week = rows[0][3] if rows else None
+    return to_matrix([row[:3] for row in rows], last_week, n_weeks)
+
+
+def benchmark(conn, n_weeks=8, kind="rolling", repetitions=3):
+    """Median time of the SQL pushdown, the materialized read and the Python engine"""
+    def timed(func):
+        timings = []
+        for _ in range(repetitions):
+            start_time = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start_time)
+        return result, float(np.median(timings))
+
+    (sql_counts, _), sql_time = timed(lambda: compute_matrix(conn, n_weeks, kind))
+    (python_counts, _), python_time = timed(
+        lambda: build_retention_matrix(stream_weekly_active_users(conn), n_weeks, kind))
+    materialize_matrix(conn, n_weeks, kind)
+    _, read_time = timed(lambda: read_materialized(conn, n_weeks, kind))
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*), COUNT(DISTINCT user_id) FROM events")
+        events, users = cur.fetchone()
+    conn.rollback()
+
+    python_counts = python_counts.reindex(sql_counts.index)
+    matches = np.allclose(sql_counts.values, python_counts.values, equal_nan=True)
+    print(f"Data size: {events:,} events, {users:,} users, {len(sql_counts)} cohorts ({kind})")
+    print(f"SQL pushdown:      {sql_time:.3f}s")
+    print(f"Python engine:     {python_time:.3f}s")
+    print(f"Materialized read: {read_time:.4f}s")
+    print(f"Results match: {matches}, faster engine: {'SQL' if sql_time < python_time else 'Python'}")
+    return {"events": events, "users": users, "sql_s": sql_time, "python_s": python_time,
+            "materialized_read_s": read_time, "matches": matches}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cohort retention computed inside PostgreSQL")
+    parser.add_argument("command", choices=["show", "materialize", "benchmark"])
+    parser.add_argument("--weeks", type=int, default=8, help="week offsets tracked per cohort")
+    parser.add_argument("--kind", choices=list(QUERIES), default="rolling")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    conn = get_connection()
+    try:
+        if args.command == "benchmark":
+            benchmark(conn, args.weeks, args.kind)
+        elif args.command == "materialize":
+            start_time = time.perf_counter()
+            rows = materialize_matrix(conn, args.weeks, args.kind)
+            print(f"Stored {rows} cells in cohort_retention_matrix in {time.perf_counter() - start_time:.2f}s")
+        else:
+            counts, sizes = compute_matrix(conn, args.weeks, args.kind)
+            print((counts[sizes > 0].div(sizes[sizes > 0], axis=0) * 100).round(1).to_string())
+    finally:
+        release_connection(conn)
@@ -0,0 +1,285 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import EVENT_LOAD_LOCK, get_connection, release_connection
+from cohort_retention import build_retention_matrix, stream_weekly_active_users
+
+STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "retention_state.npz")
+
+# Number of set bits in every byte value
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# The newest event at or below the watermark identifies the dataset the state was built from
+FINGERPRINT_QUERY = """
+SELECT event_id, timestamp, user_id
+FROM events
+WHERE event_id <= %s
+ORDER BY event_id DESC
+LIMIT 1
+"""
+
+
+def _bit_positions(user_ids):
+    return user_ids // 8, (np.uint8(128) >> (user_ids % 8).astype(np.uint8)).astype(np.uint8)
+
+
+class IncrementalRetention:
+    """Weekly cohort retention kept up to date from new events only
+
+    State per user: first active week. Per week: a bitmap of the users active that week.
+    Per cohort: a bitmap of its members. Cell (c, k) is popcount(members[c] & active[c + k]),
+    so new events only force a recount of the cells whose week or cohort they touched.
+    """
+
+    def __init__(self, n_weeks=8):
+        self.n_weeks = n_weeks
+        self.base_week = None  # date of week index 0
+        self.watermark = 0  # last event_id folded in
+        self.fingerprint = ""  # "event_id|timestamp|user_id" of the newest event folded in
+        self.first_week = np.full(0, -1, dtype=np.int32)
+        self.active = np.zeros((0, 0), dtype=np.uint8)
+        self.members = np.zeros((0, 0), dtype=np.uint8)
+        self.counts = np.zeros((0, n_weeks), dtype=np.int64)
+
+    # --- persistence -------------------------------------------------------------------
+
+    def save(self, path=STATE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez_compressed(
+            path, n_weeks=self.n_weeks, watermark=self.watermark, fingerprint=self.fingerprint,
+            base_week=np.datetime64(self.base_week or "NaT", "D"),
+            first_week=self.first_week, active=self.active, members=self.members, counts=self.counts
+        )
+
+    @classmethod
+    def load(cls, path=STATE_PATH, n_weeks=8):
+        state = cls(n_weeks)
+        if not os.path.exists(path):
+            return state
+        with np.load(path) as data:
+            if int(data["n_weeks"]) != n_weeks:
+                raise ValueError(f"state at {path} tracks {int(data['n_weeks'])} weeks, rebuild it")
+            state.watermark = int(data["watermark"])
+            state.fingerprint = str(data["fingerprint"]) if "fingerprint" in data else ""
+            base = data["base_week"]
+            state.base_week = None if np.isnat(base) else base.item()
+            state.first_week = data["first_week"]
+            state.active = data["active"]
+            state.members = data["members"]
+            state.counts = data["counts"]
+        return state
+
+    # --- growth ------------------------------------------------------------------------
+
+    def _ensure_capacity(self, max_user_id, min_week, max_week):
+        """Grow the arrays for new users/weeks; weeks older than base_week shift every index"""
+        if self.base_week is None:
+            self.base_week = min_week
+        shift = max((self.base_week - min_week).days // 7, 0)
+        if shift:
+            self.base_week = min_week
+            known = self.first_week >= 0
+            self.first_week[known] += shift
+            self.active = np.vstack([np.zeros((shift, self.active.shape[1]), np.uint8), self.active])
+            self.members = np.vstack([np.zeros((shift, self.members.shape[1]), np.uint8), self.members])
+            self.counts = np.vstack([np.zeros((shift, self.n_weeks), np.int64), self.counts])
+
+        n_weeks_total = (max_week - self.base_week).days // 7 + 1
+        extra_weeks = n_weeks_total - self.active.shape[0]
+        if extra_weeks > 0:
+            self.active = np.vstack([self.active, np.zeros((extra_weeks, self.active.shape[1]), np.uint8)])
+            self.members = np.vstack([self.members, np.zeros((extra_weeks, self.members.shape[1]), np.uint8)])
+            self.counts = np.vstack([self.counts, np.zeros((extra_weeks, self.n_weeks), np.int64)])
+
+        if max_user_id >= self.first_week.size:
+            size = max(max_user_id + 1, 2 * self.first_week.size)
+            self.first_week = np.concatenate(
+                [self.first_week, np.full(size - self.first_week.size, -1, dtype=np.int32)])
+            n_bytes = (size + 7) // 8
+            pad = n_bytes - self.active.shape[1]
+            self.active = np.hstack([self.active, np.zeros((self.active.shape[0], pad), np.uint8)])
+            self.members = np.hstack([self.members, np.zeros((self.members.shape[0], pad), np.uint8)])
+
+    # --- update ------------------------------------------------------------------------
+
+    def apply(self, weeks, user_ids):
+        """Fold distinct (week_start date, user_id) pairs in and recount only the affected cells"""
+        if len(user_ids) == 0:
+            return 0
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        self._ensure_capacity(int(user_ids.max()), min(weeks), max(weeks))
+        base = np.datetime64(self.base_week, "D")
+        week_index = ((np.asarray(weeks, dtype="datetime64[D]") - base).astype(np.int64) // 7)
+
+        # Activity bits that were not already set mark the weeks whose cells change
+        byte, mask = _bit_positions(user_ids)
+        newly_active = (self.active[week_index, byte] & mask) == 0
+        np.bitwise_or.at(self.active, (week_index, byte), mask)
+        dirty_weeks = set(np.unique(week_index[newly_active]).tolist())
+
+        # Users whose first week moved (new users, or late events older than their first week)
+        # Earliest week per distinct user of the batch, so the cost follows the batch size
+        users, inverse = np.unique(user_ids, return_inverse=True)
+        candidate = np.full(users.size, np.iinfo(np.int32).max, dtype=np.int64)
+        np.minimum.at(candidate, inverse, week_index)
+        current = self.first_week[users]
+        earlier = candidate < np.where(current >= 0, current, np.iinfo(np.int32).max)
+        moved = users[earlier]
+        old_cohorts = current[earlier]
+        new_cohorts = candidate[earlier].astype(np.int32)
+
+        byte, mask = _bit_positions(moved)
+        had_cohort = old_cohorts >= 0
+        np.bitwise_and.at(self.members, (old_cohorts[had_cohort], byte[had_cohort]), ~mask[had_cohort])
+        np.bitwise_or.at(self.members, (new_cohorts, byte), mask)
+        self.first_week[moved] = new_cohorts
+        dirty_cohorts = set(old_cohorts[had_cohort].tolist()) | set(new_cohorts.tolist())
+
+        cells = {(c, k) for c in dirty_cohorts for k in range(self.n_weeks)}
+        for week in dirty_weeks:
+            for k in range(self.n_weeks):
+                if week - k >= 0:
+                    cells.add((week - k, k))
+        last_week = self.active.shape[0] - 1
+        for cohort, offset in cells:
+            if cohort + offset <= last_week:
+                overlap = self.members[cohort] & self.active[cohort + offset]
+                self.counts[cohort, offset] = int(POPCOUNT[overlap].sum(dtype=np.int64))
+        return len(cells)
+
+    @staticmethod
+    def _fingerprint(cur, event_id):
+        cur.execute(FINGERPRINT_QUERY, (event_id,))
+        row = cur.fetchone()
+        return "" if row is None else f"{row[0]}|{row[1].isoformat()}|{row[2]}"
+
+    def update_from_db(self, conn, batch_size=500_000, up_to_event_id=None):
+        """Process only events past the watermark; returns (events folded in, cells recounted)
+
+        Waits for event loads in progress first, since parallel loads commit ids out of order.
+        Event ids restart when events is reloaded, so the newest folded-in event must still be
+        the same row, or the update refuses to run on a state built from another dataset.
+        """
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (EVENT_LOAD_LOCK,))
+            if self.watermark and self._fingerprint(cur, self.watermark) != self.fingerprint:
+                conn.rollback()
+                raise ValueError(f"event {self.watermark:,} no longer matches the state: "
+                                 f"events was reloaded, run rebuild")
+            if up_to_event_id is None:
+                cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM events")
+                up_to_event_id = cur.fetchone()[0]
+        if up_to_event_id <= self.watermark:
+            conn.rollback()
+            return 0, 0
+
+        cells = 0
+        with conn.cursor(name="retention_increment") as cur:
+            cur.itersize = batch_size
+            cur.execute("""
+            SELECT DISTINCT DATE_TRUNC('week', timestamp)::date, user_id
+            FROM events
+            WHERE event_id > %s AND event_id <= %s AND user_id IS NOT NULL
+            """, (self.watermark, up_to_event_id))
+            while True:
+                batch = cur.fetchmany(batch_size)
+                if not batch:
+                    break
+                weeks = [row[0] for row in batch]
+                user_ids = np.fromiter((row[1] for row in batch), dtype=np.int64, count=len(batch))
+                cells += self.apply(weeks, user_ids)
+        with conn.cursor() as cur:
+            fingerprint = self._fingerprint(cur, up_to_event_id)
+        conn.rollback()
+        folded = up_to_event_id - self.watermark
+        self.watermark = up_to_event_id
+        self.fingerprint = fingerprint
+        return folded, cells
+
+    # --- output ------------------------------------------------------------------------
+
+    def to_frame(self):
+        """(counts, cohort sizes) in the same layout as cohort_retention.build_retention_matrix"""
+        n_total = self.active.shape[0]
+        matrix = self.counts.astype(float)
+        for cohort in range(n_total):
+            matrix[cohort, n_total - cohort:] = np.nan
+        weeks = [self.base_week + timedelta(days=7 * i) for i in range(n_total)]
+        index = pd.Index(weeks, name="cohort_week")
+        sizes = pd.Series(POPCOUNT[self.members].sum(axis=1, dtype=np.int64), index=index, name="cohort_size")
+        return pd.DataFrame(matrix, index=index, columns=[f"Week {k}" for k in range(self.n_weeks)]), sizes
+
+
+def benchmark(conn, n_weeks=8, holdout=0.05):
+    """Full rebuild vs incremental update of the newest `holdout` share of events
+
+    The state is saved and reloaded between the two updates, like `update` runs do.
+    """
+    start_time = time.perf_counter()
+    full_counts, _ = build_retention_matrix(stream_weekly_active_users(conn), n_weeks, "classic")
+    full_time = time.perf_counter() - start_time
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MAX(event_id), 0) FROM events")
+        max_event_id = cur.fetchone()[0]
+    split = int(max_event_id * (1 - holdout))
+
+    state = IncrementalRetention(n_weeks)
+    state.update_from_db(conn, up_to_event_id=split)
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_path = os.path.join(state_dir, "retention_state.npz")
+        state.save(state_path)
+        state = IncrementalRetention.load(state_path, n_weeks)
+    start_time = time.perf_counter()
+    folded, cells = state.update_from_db(conn, up_to_event_id=max_event_id)
+    incremental_time = time.perf_counter() - start_time
+
+    incremental_counts, _ = state.to_frame()
+    incremental_counts = incremental_counts.reindex(full_counts.index)
+    matches = np.allclose(full_counts.values, incremental_counts.values, equal_nan=True)
+
+    print(f"Full rebuild:       {full_time:.3f}s")
+    print(f"Incremental update: {incremental_time:.3f}s for the newest {folded:,} events "
+          f"({holdout:.0%}), {cells} cells recounted")
+    print(f"Speedup: {full_time / incremental_time:.1f}x, matrices match: {matches}")
+    return full_time, incremental_time, matches
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Incrementally maintain the weekly retention matrix")
+    parser.add_argument("command", choices=["update", "rebuild", "benchmark"],
+                        help="update: fold in events past the watermark, rebuild: start from an empty state")
+    parser.add_argument("--weeks", type=int, default=8, help="week offsets tracked per cohort")
+    parser.add_argument("--state", default=STATE_PATH, help="where the bitmaps and watermark are stored")
+    parser.add_argument("--holdout", type=float, default=0.05,
+                        help="benchmark: share of the newest events applied incrementally")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    conn = get_connection()
+    try:
+        if args.command == "benchmark":
+            benchmark(conn, args.weeks, args.holdout)
+        else:
+            state = (IncrementalRetention(args.weeks) if args.command == "rebuild"
+                     else IncrementalRetention.load(args.state, args.weeks))
+            start_time = time.perf_counter()
+            folded, cells = state.update_from_db(conn)
+            state.save(args.state)
+            print(f"Folded {folded:,} events in {time.perf_counter() - start_time:.2f}s, "
+                  f"recounted {cells} cells, watermark at event {state.watermark:,}")
+    except ValueError as e:
+        print(f"An error occurred: {e}")
+    finally:
+        release_connection(conn)
@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from clustering import nearest_centroid, sample_rows
+from embedding_cache import CACHE_DIR, EmbeddingCache, normalize_query
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "query_index")
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class IVFIndex:
+    """Inverted-file index for cosine search, with optional product quantization
+
+    Vectors are normalized, bucketed by their nearest coarse centroid and stored contiguously
+    per bucket, so a query scans only the n_probe buckets closest to it. With pq > 0 each
+    vector's residual from its bucket centroid is stored as `pq` one-byte codes instead of
+    float32, and scored as q.centroid plus a per-query lookup table sum. Every array is saved
+    as .npy and memory-mapped on load.
+    """
+
+    def __init__(self, centroids, offsets, keys, vectors=None, codes=None, codebooks=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.keys = keys
+        self.vectors = vectors
+        self.codes = codes
+        self.codebooks = codebooks
+        self._positions = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, vectors, keys, n_lists=None, pq=0, batch_size=65_536, random_state=42):
+        """Index the rows of `vectors` (array or memmap), processed batch_size rows at a time"""
+        n, dim = vectors.shape
+        n_lists = n_lists or max(1, min(n, int(4 * np.sqrt(n))))
+        sample = normalize_rows(sample_rows(vectors, max(50 * n_lists, 20_000), random_state))
+        coarse = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, n_init=1,
+                                 batch_size=4096).fit(sample)
+        centroids = normalize_rows(coarse.cluster_centers_)
+
+        lists = np.empty(n, dtype=np.int32)
+        for start in range(0, n, batch_size):
+            lists[start:start + batch_size], _ = nearest_centroid(
+                normalize_rows(vectors[start:start + batch_size]), centroids)
+        order = np.argsort(lists, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=n_lists))]).astype(np.int64)
+
+        codebooks = None
+        if pq:
+            if dim % pq:
+                raise ValueError(f"pq={pq} must divide the embedding dimension {dim}")
+            sub = dim // pq
+            n_codes = min(256, len(sample))
+            residuals = sample - centroids[nearest_centroid(sample, centroids)[0]]
+            codebooks = np.stack([
+                MiniBatchKMeans(n_clusters=n_codes, random_state=random_state, n_init=1, batch_size=4096)
+                .fit(residuals[:, m * sub:(m + 1) * sub]).cluster_centers_
+                for m in range(pq)
+            ]).astype(np.float32)
+
+        stored = np.empty((n, pq), dtype=np.uint8) if pq else np.empty((n, dim), dtype=np.float32)
+        for start in range(0, n, batch_size):
+            rows = order[start:start + batch_size]
+            block = normalize_rows(vectors[np.sort(rows)])[np.argsort(np.argsort(rows))]
+            if pq:
+                block = cls._encode(block - centroids[lists[rows]], codebooks)
+            stored[start:start + len(rows)] = block
+        keys = [keys[i] for i in order]
+        if pq:
+            return cls(centroids, offsets, keys, codes=stored, codebooks=codebooks)
+        return cls(centroids, offsets, keys, vectors=stored)
+
+    @staticmethod
+    def _encode(block, codebooks):
+        pq, n_codes, sub = codebooks.shape
+        codes = np.empty((len(block), pq), dtype=np.uint8)
+        for m in range(pq):
+            part = block[:, m * sub:(m + 1) * sub]
+            distances = (part ** 2).sum(axis=1)[:, None] - 2 * part @ codebooks[m].T \
+                + (codebooks[m] ** 2).sum(axis=1)
+            codes[:, m] = distances.argmin(axis=1)
+        return codes
+
+    def _scores(self, query, rows, base):
+        """Scores of stored rows; base holds q.centroid of each row's list (used with PQ)"""
+        if self.codes is None:
+            return np.asarray(self.vectors[rows]) @ query
+        pq, _, sub = self.codebooks.shape
+        # Inner product of each query slice with every code word, then summed per stored vector
+        table = np.einsum("md,mcd->mc", query.reshape(pq, sub), self.codebooks)
+        return base + table[np.arange(pq), np.asarray(self.codes[rows])].sum(axis=1)
+
+    def search(self, queries, k=10, n_probe=8):
+        """Top-k [(key, cosine score)] per query vector, scanning the n_probe closest lists"""
+        queries = normalize_rows(np.atleast_2d(queries))
+        n_probe = min(n_probe, len(self.centroids))
+        closeness = queries @ self.centroids.T
+        probes = np.argpartition(-closeness, n_probe - 1, axis=1)[:, :n_probe]
+        results = []
+        for query, lists, near in zip(queries, probes, closeness):
+            sizes = self.offsets[lists + 1] - self.offsets[lists]
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if rows.size == 0:
+                results.append([])
+                continue
+            scores = self._scores(query, rows, np.repeat(near[lists], sizes))
+            top = np.argpartition(-scores, min(k, rows.size) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results.append([(self.keys[rows[i]], float(scores[i])) for i in top])
+        return results
+
+    def similar(self, key, k=10, n_probe=8):
+        """Neighbours of an indexed key (a normalized query or a user id), itself excluded"""
+        if self._positions is None:
+            self._positions = {key: i for i, key in enumerate(self.keys)}
+        position = self._positions[key]
+        if self.codes is None:
+            vector = np.asarray(self.vectors[position])
+        else:
+            pq, _, sub = self.codebooks.shape
+            bucket = np.searchsorted(self.offsets, position, side="right") - 1
+            vector = self.centroids[bucket] + \
+                self.codebooks[np.arange(pq), np.asarray(self.codes[position])].reshape(pq * sub)
+        return [hit for hit in self.search(vector, k + 1, n_probe)[0] if hit[0] != key][:k]
+
+    def save(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, "centroids.npy"), self.centroids)
+        np.save(os.path.join(index_dir, "offsets.npy"), self.offsets)
+        if self.codes is None:
+            np.save(os.path.join(index_dir, "vectors.npy"), self.vectors)
+        else:
+            np.save(os.path.join(index_dir, "codes.npy"), self.codes)
+            np.save(os.path.join(index_dir, "codebooks.npy"), self.codebooks)
+        with open(os.path.join(index_dir, "keys.txt"), "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key in self.keys)
+        with open(os.path.join(index_dir, "meta.json"), "w") as f:
+            json.dump({"size": len(self.keys), "lists": len(self.centroids),
+                       "pq": 0 if self.codes is None else int(self.codes.shape[1])}, f)
+
+    @classmethod
+    def load(cls, index_dir):
+        """Open a saved index; the stored vectors/codes stay on disk, memory-mapped"""
+        def path(name):
+            return os.path.join(index_dir, name)
+        with open(path("keys.txt"), encoding="utf-8") as f:
+            keys = [line.rstrip("\n") for line in f]
+        centroids = np.load(path("centroids.npy"))
+        offsets = np.load(path("offsets.npy"))
+        if os.path.exists(path("codes.npy")):
+            return cls(centroids, offsets, keys, codes=np.load(path("codes.npy"), mmap_mode="r"),
+                       codebooks=np.load(path("codebooks.npy")))
+        return cls(centroids, offsets, keys, vectors=np.load(path("vectors.npy"), mmap_mode="r"))
+
+
+def benchmark(index, vectors, keys, n_queries=200, k=10, n_probes=(1, 4, 16), random_state=42):
+    """Recall@k and per-query latency of the index against exact brute-force cosine search"""
+    rng = np.random.default_rng(random_state)
+    picks = rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)
+    queries = normalize_rows(vectors[np.sort(picks)])
+    normalized = normalize_rows(vectors)
+
+    # Exact cosine search one query at a time, like the index, so latencies compare like for like
+    exact = []
+    start_time = time.perf_counter()
+    for query in queries:
+        scores = normalized @ query
+        exact.append({keys[i] for i in np.argpartition(-scores, k - 1)[:k]})
+    exact_ms = (time.perf_counter() - start_time) * 1000 / len(queries)
+
+    print(f"Index: {len(index):,} vectors, {len(index.centroids)} lists, "
+          f"{'PQ ' + str(index.codes.shape[1]) + ' bytes/vector' if index.codes is not None else 'float32 vectors'}")
+    print(f"Brute force: {exact_ms:.2f} ms/query")
+    results = []
+    for n_probe in n_probes:
+        latencies = []
+        recall = 0.0
+        for query, truth in zip(queries, exact):
+            start_time = time.perf_counter()
+            hits = index.search(query, k, n_probe)[0]
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            recall += len(truth & {key for key, _ in hits}) / len(truth)
+        recall /= len(queries)
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f"n_probe={n_probe:<4} recall@{k}={recall:.3f}  p50={p50:.2f} ms  p95={p95:.2f} ms  "
+              f"speedup={exact_ms / p50:.1f}x")
+        results.append({"n_probe": n_probe, "recall": recall, "p50_ms": p50, "p95_ms": p95,
+                        "brute_force_ms": exact_ms})
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Approximate nearest-neighbour index over query embeddings")
+    parser.add_argument("command", choices=["build", "query", "benchmark"])
+    parser.add_argument("text", nargs="?", help="query: search text, or an indexed key with --key")
+    parser.add_argument("--key", action="store_true", help="query: look up neighbours of an indexed key")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="embedding cache the index is built from")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists (default 4 * sqrt(n))")
+    parser.add_argument("--pq", type=int, default=0, help="bytes per vector with product quantization, 0 = float32")
+    parser.add_argument("-k", type=int, default=10, help="neighbours returned")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 4, 16], help="lists scanned per query")
+    parser.add_argument("--queries", type=int, default=200, help="benchmark: sampled query vectors")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "query":
+        index = IVFIndex.load(args.index_dir)
+        if args.key:
+            hits = index.similar(args.text, args.k, args.n_probe[-1])
+        else:
+            from behavioral_segmentation import get_embeddings
+            hits = index.search(get_embeddings([normalize_query(args.text)]), args.k, args.n_probe[-1])[0]
+        for key, score in hits:
+            print(f"{score:.3f}  {key}")
+    else:
+        cache = EmbeddingCache(args.cache_dir)
+        vectors = cache.stored()
+        keys = sorted(cache.index, key=cache.index.get)
+        if args.command == "build":
+            start_time = time.perf_counter()
+            index = IVFIndex.build(vectors, keys, args.lists, args.pq)
+            index.save(args.index_dir)
+            print(f"Indexed {len(index):,} cached queries into {len(index.centroids)} lists "
+                  f"in {time.perf_counter() - start_time:.2f}s, saved to {args.index_dir}")
+        else:
+            benchmark(IVFIndex.load(args.index_dir), vectors, keys, args.queries, args.k, args.n_probe)
@@ -1,17 +1,24 @@
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
-from sklearn.cluster import KMeans
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import argparse
 import os
+import threading
 from dotenv import load_dotenv
+from clustering import SEGMENT_SEEDS, fit_streaming, label_centroids, predict_streaming, select_k
+from embedding_cache import CACHE_DIR, EmbeddingCache
+from segment_model import MODEL_PATH, SegmentModel
+from user_profiles import UserProfileBuilder, parse_timestamp
 
 # Load environment variables
 load_dotenv()
 
+# elasticsearch, sentence_transformers (torch) and sklearn are imported where they are first
+# needed, so importing this module or running a read-only command stays fast
+
 def connect_to_elasticsearch():
     """Create Elasticsearch connection"""
     try:
+        from elasticsearch import Elasticsearch
         print("Attempting to connect to Elasticsearch...")
         es = Elasticsearch(
             "https://localhost:9200",
@@ -35,51 +42,157 @@ def connect_to_elasticsearch():
         print("\nTroubleshooting steps:")
         raise
 
-def extract_search_history(es):
-    """Extract user search history from Elasticsearch"""
-    query = {
-        "size": 1000,  # Adjust based on your needs
-        "_source": ["user_id", "search_query", "clicked_product_ids"]
-    }
-    
-    response = es.search(index="user_sessions", body=query)
-    return response['hits']['hits']
-
-def get_embeddings(search_queries):
-    """Convert search queries to embeddings using Sentence-Transformers"""
-    model = SentenceTransformer('all-MiniLM-L6-v2')  # Free and lightweight model
-    embeddings = model.encode(search_queries)
-    return embeddings
-
-def cluster_users(embeddings, n_clusters=5):
-    """Cluster users based on their search embeddings"""
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    clusters = kmeans.fit_predict(embeddings)
-    return clusters
-
-def assign_segment_labels(cluster_id):
-    """Map cluster IDs to meaningful segment labels"""
-    segment_mapping = {
-        0: "tech_enthusiast",
-        1: "budget_conscious",
-        2: "fashion_oriented",
-        3: "luxury_seeker",
-        4: "home_improvement"
+SESSION_FIELDS = ["user_id", "search_query", "clicked_product_ids", "timestamp"]
+
+def extract_search_history(es, batch_size=1000, fields=SESSION_FIELDS, keep_alive="2m", query=None):
+    """Stream every user session (or those matching query) as lists of at most batch_size _source dicts
+
+    Pages through a point-in-time snapshot with search_after, so memory stays constant
+    and documents indexed meanwhile neither shift nor duplicate pages.
+    """
+    pit_id = es.open_point_in_time(index="user_sessions", keep_alive=keep_alive)["id"]
+    try:
+        search_after = None
+        while True:
+            response = es.search(
+                size=batch_size,
+                source=fields,
+                pit={"id": pit_id, "keep_alive": keep_alive},
+                sort=[{"_shard_doc": "asc"}],
+                search_after=search_after,
+                query=query,
+                track_total_hits=False
+            )
+            pit_id = response.get('pit_id', pit_id)
+            hits = response['hits']['hits']
+            if not hits:
+                break
+            yield [hit['_source'] for hit in hits]
+            if len(hits) < batch_size:
+                break
+            search_after = hits[-1]['sort']
+    finally:
+        es.close_point_in_time(id=pit_id)
+
+MODEL_NAME = 'all-MiniLM-L6-v2'  # Free and lightweight model
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Load the Sentence-Transformers model once per process, on first use"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+def get_embeddings(search_queries, cache=None, batch_size=64):
+    """Convert search queries to embeddings using Sentence-Transformers
+
+    With a cache only queries that were never embedded before are encoded, batch_size at a time.
+    """
+    model = get_model()
+    if cache is None:
+        return model.encode(search_queries, batch_size=batch_size)
+    return cache.get(search_queries, lambda batch: model.encode(batch, batch_size=batch_size), batch_size)
+
+def cluster_users(embeddings, n_clusters=5, backend="minibatch", batch_size=4096, k_values=None):
+    """Cluster users based on their profile vectors; returns (cluster ids, centroids)
+
+    minibatch trains MiniBatchKMeans with partial_fit one block of rows at a time, kmeans is the
+    full-batch in-memory fit. With k_values, k is chosen by silhouette score on a sample.
+    """
+    if k_values:
+        n_clusters, scores = select_k(embeddings, k_values)
+        print("Silhouette scores: " + ", ".join(f"k={k}: {score:.3f}" for k, score in scores.items())
+              + f" -> k={n_clusters}")
+    n_clusters = min(n_clusters, len(embeddings))
+    if backend == "kmeans":
+        from sklearn.cluster import KMeans
+        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+        clusters = kmeans.fit_predict(embeddings)
+        return clusters, kmeans.cluster_centers_
+    model = fit_streaming(embeddings, n_clusters, batch_size)
+    return predict_streaming(model, embeddings, batch_size), model.cluster_centers_
+
+def assign_segment_labels(centroids, cache=None):
+    """Map cluster IDs to meaningful segment labels by their closest seed phrases
+
+    KMeans cluster ids are arbitrary from one run to the next, the seed phrases are not.
+    """
+    seed_vectors = {
+        name: np.asarray(get_embeddings(phrases, cache)).mean(axis=0)
+        for name, phrases in SEGMENT_SEEDS.items()
     }
-    return segment_mapping.get(cluster_id, "undefined")
+    return label_centroids(np.asarray(centroids), seed_vectors)
+
+def changed_users(es, watermark, batch_size=1000):
+    """(ids of users with sessions newer than watermark, newest session timestamp seen)"""
+    users = set()
+    latest = watermark
+    query = {"range": {"timestamp": {"gt": watermark}}}
+    for sessions in extract_search_history(es, batch_size, ["user_id", "timestamp"], query=query):
+        users.update(session['user_id'] for session in sessions)
+        latest = max([latest] + [session['timestamp'] for session in sessions if session.get('timestamp')],
+                     key=parse_timestamp)
+    return sorted(users), latest
+
+def stored_segments(es, user_ids, chunk_size=1000):
+    """Current segment of each user in user_segments, fetched with mget"""
+    segments = {}
+    for start in range(0, len(user_ids), chunk_size):
+        response = es.mget(index="user_segments", ids=user_ids[start:start + chunk_size], source=["segment"])
+        for doc in response['docs']:
+            if doc.get('found'):
+                segments[doc['_id']] = doc['_source'].get('segment')
+    return segments
+
+def bulk_write(es, actions, chunk_size=500, thread_count=1, **kwargs):
+    """Send actions as chunked bulk requests and report the items that failed
+
+    thread_count > 1 sends chunks concurrently with parallel_bulk, otherwise streaming_bulk
+    sends them one after another and retries rejected (429) items with backoff.
+    Returns (succeeded, failed items).
+    """
+    from elasticsearch import helpers
+    if thread_count > 1:
+        results = helpers.parallel_bulk(es, actions, thread_count=thread_count, chunk_size=chunk_size,
+                                        raise_on_error=False, raise_on_exception=False, **kwargs)
+    else:
+        results = helpers.streaming_bulk(es, actions, chunk_size=chunk_size, max_retries=3,
+                                         raise_on_error=False, raise_on_exception=False, **kwargs)
+    succeeded = 0
+    errors = []
+    for ok, item in results:
+        if ok:
+            succeeded += 1
+        else:
+            errors.append(item)
+    for item in errors[:10]:
+        op_type, result = next(iter(item.items()))
+        print(f"Bulk {op_type} failed for {result.get('_id')}: {result.get('status')} {result.get('error')}")
+    if len(errors) > 10:
+        print(f"... and {len(errors) - 10} more failed items")
+    return succeeded, errors
 
-def update_elasticsearch_with_segments(es, user_segments):
+def update_elasticsearch_with_segments(es, user_segments, chunk_size=500, thread_count=1):
     """Store user segments back to Elasticsearch"""
-    for user_id, segment in user_segments.items():
-        doc = {
-            "segment": segment,
-            "updated_at": datetime.now().isoformat()
+    updated_at = datetime.now().isoformat()
+    actions = (
+        {
+            "_op_type": "update",
+            "_index": "user_segments",
+            "_id": user_id,
+            "doc": {"segment": segment, "updated_at": updated_at},
+            "doc_as_upsert": True
         }
-        es.update(
-            index="user_segments",
-            id=user_id,
-            body={"doc": doc, "doc_as_upsert": True}
-        )
+        for user_id, segment in user_segments.items()
+    )
+    succeeded, errors = bulk_write(es, actions, chunk_size, thread_count)
+    print(f"Wrote {succeeded} segments to user_segments ({len(errors)} failed)")
+    return succeeded, errors
 
 def create_required_indices(es):
     """Create required Elasticsearch indices if they don't exist"""
@@ -90,7 +203,8 @@ def create_required_indices(es):
                 "properties": {
                     "user_id": {"type": "keyword"},
                     "search_query": {"type": "text"},
-                    "clicked_product_ids": {"type": "keyword"}
+                    "clicked_product_ids": {"type": "keyword"},
+                    "timestamp": {"type": "date"}
                 }
             }
         }
@@ -111,11 +225,13 @@ def create_required_indices(es):
             print("Created user_sessions index")
             
             # Add sample data for testing
+            now = datetime.now(timezone.utc)
             sample_data = [
                 {
                     "user_id": f"user_{i}",
                     "search_query": query,
-                    "clicked_product_ids": [f"product_{j}" for j in range(2)]
+                    "clicked_product_ids": [f"product_{j}" for j in range(2)],
+                    "timestamp": (now - timedelta(days=i)).isoformat()
                 }
                 for i, query in enumerate([
                     "gaming laptop",
@@ -126,9 +242,8 @@ def create_required_indices(es):
                 ])
             ]
             
-            # Bulk index sample data
-            for doc in sample_data:
-                es.index(index="user_sessions", document=doc)
+            # Bulk index sample data, visible to the extraction right after
+            bulk_write(es, ({"_index": "user_sessions", "_source": doc} for doc in sample_data), refresh=True)
             print("Added sample data to user_sessions")
             
         if not es.indices.exists(index="user_segments"):
@@ -139,40 +254,119 @@ def create_required_indices(es):
         print(f"Error creating indices: {str(e)}")
         raise
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Segment users by their search history")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="where query embeddings are cached")
+    parser.add_argument("--no-cache", action="store_true", help="encode every query again")
+    parser.add_argument("--batch-size", type=int, default=64, help="queries encoded per model call")
+    parser.add_argument("--scan-size", type=int, default=1000, help="sessions fetched per Elasticsearch page")
+    parser.add_argument("--half-life-days", type=float, default=None,
+                        help="weight each session by recency with this half-life (default: plain mean)")
+    parser.add_argument("--click-buckets", type=int, default=32, help="hashed click features per user")
+    parser.add_argument("--backend", choices=["minibatch", "kmeans"], default="minibatch",
+                        help="minibatch: streaming partial_fit, kmeans: full-batch fit in memory")
+    parser.add_argument("--clusters", type=int, default=5, help="number of segments when --auto-k is off")
+    parser.add_argument("--auto-k", type=int, nargs=2, metavar=("MIN", "MAX"),
+                        help="choose k in [MIN, MAX] by silhouette score on a sample")
+    parser.add_argument("--cluster-batch-size", type=int, default=4096, help="rows per partial_fit call")
+    parser.add_argument("--incremental", action="store_true",
+                        help="assign only users with new sessions to the stored centroids")
+    parser.add_argument("--drift-threshold", type=float, default=1.25,
+                        help="refit when new users sit this many times farther from their centroid than at fit time")
+    parser.add_argument("--model-path", default=MODEL_PATH, help="where centroids and the label map are stored")
+    parser.add_argument("--storage", choices=["float32", "float16", "int8"], default="float32",
+                        help="how user profiles are held in memory for clustering")
+    parser.add_argument("--cache-storage", choices=["float32", "float16", "int8"], default=None,
+                        help="storage type of a new embedding cache (default: whatever the cache holds, "
+                             "float32 when it is new)")
+    parser.add_argument("--user-index", default=None,
+                        help="also build a nearest-neighbour index of user profiles in this directory")
+    parser.add_argument("--chunk-size", type=int, default=500, help="segment updates per bulk request")
+    parser.add_argument("--threads", type=int, default=1, help="concurrent bulk requests (parallel_bulk if > 1)")
+    return parser.parse_args()
+
+def build_profiles(es, args, cache, builder, query=None):
+    """Stream the search history page by page and fold each page into one profile per user"""
+    for sessions in extract_search_history(es, args.scan_size, query=query):
+        embeddings = get_embeddings([session['search_query'] for session in sessions], cache, args.batch_size)
+        builder.add_sessions(sessions, embeddings)
+    return builder
+
+def run_full(es, args, cache):
+    """Fit centroids on every user, rewrite all segments and store the model"""
+    builder = build_profiles(es, args, cache, UserProfileBuilder(click_buckets=args.click_buckets,
+                                                                 half_life_days=args.half_life_days))
+    user_ids, profiles = builder.profiles(args.storage)
+    print(f"Aggregated {builder.sessions} sessions into {len(user_ids)} user profiles")
+
+    # Perform clustering over users, not sessions
+    k_values = range(args.auto_k[0], args.auto_k[1] + 1) if args.auto_k else None
+    clusters, centroids = cluster_users(profiles, args.clusters, args.backend, args.cluster_batch_size, k_values)
+    label_map = assign_segment_labels(centroids, cache)
+    
+    # Create user segments dictionary
+    user_segments = {user_id: label_map[int(cluster_id)] for user_id, cluster_id in zip(user_ids, clusters)}
+    
+    # Update Elasticsearch with segments
+    update_elasticsearch_with_segments(es, user_segments, args.chunk_size, args.threads)
+
+    model = SegmentModel.fit(profiles, centroids, label_map, builder.latest, args.click_buckets, args.half_life_days)
+    model.save(args.model_path)
+    print(f"Successfully processed {len(user_ids)} users, model saved to {args.model_path}")
+
+    if args.user_index:
+        from ann_index import IVFIndex
+        IVFIndex.build(profiles, [str(user_id) for user_id in user_ids]).save(args.user_index)
+        print(f"Saved the user similarity index to {args.user_index}")
+
+def run_incremental(es, args, cache, model):
+    """Assign users with sessions past the watermark to the stored centroids
+
+    Returns False when a full refit is needed instead (no watermark yet, or drift above threshold).
+    """
+    if model.watermark is None:
+        return False
+    user_ids, latest = changed_users(es, model.watermark, args.scan_size)
+    if not user_ids:
+        print(f"No sessions newer than {model.watermark}, nothing to update")
+        return True
+
+    # Profiles cover the full history of each changed user, not just the new sessions
+    builder = UserProfileBuilder(click_buckets=model.click_buckets, half_life_days=model.half_life_days)
+    for start in range(0, len(user_ids), 10_000):
+        build_profiles(es, args, cache, builder, {"terms": {"user_id": user_ids[start:start + 10_000]}})
+    profile_ids, profiles = builder.profiles(args.storage)
+    segments, distances = model.assign(profiles)
+    drift = model.drift(distances)
+    print(f"{len(profile_ids)} users with new sessions, drift {drift:.2f}x the fit-time distance")
+    if drift > args.drift_threshold:
+        print(f"Drift above {args.drift_threshold:.2f}x, running a full refit")
+        return False
+
+    previous = stored_segments(es, profile_ids)
+    changed = {user_id: segment for user_id, segment in zip(profile_ids, segments) if previous.get(user_id) != segment}
+    if changed:
+        update_elasticsearch_with_segments(es, changed, args.chunk_size, args.threads)
+    model.watermark = latest
+    model.save(args.model_path)
+    print(f"Incremental run: {len(changed)} of {len(profile_ids)} segments changed, watermark at {latest}")
+    return True
+
 def main():
+    args = parse_args()
+
     # Connect to Elasticsearch
     es = connect_to_elasticsearch()
     
     # Create required indices and sample data
     create_required_indices(es)
-    
-    # Extract search history
-    search_data = extract_search_history(es)
-    
-    # Prepare data for processing
-    user_ids = []
-    search_queries = []
-    
-    for hit in search_data:
-        user_ids.append(hit['_source']['user_id'])
-        search_queries.append(hit['_source']['search_query'])
-    
-    # Generate embeddings
-    embeddings = get_embeddings(search_queries)
-    
-    # Perform clustering
-    clusters = cluster_users(embeddings)
-    
-    # Create user segments dictionary
-    user_segments = {}
-    for user_id, cluster_id in zip(user_ids, clusters):
-        segment = assign_segment_labels(cluster_id)
-        user_segments[user_id] = segment
-    
-    # Update Elasticsearch with segments
-    update_elasticsearch_with_segments(es, user_segments)
-    
-    print(f"Successfully processed {len(user_ids)} users")
+
+    cache = None if args.no_cache else EmbeddingCache(args.cache_dir, model_name=MODEL_NAME, dtype=args.cache_storage)
+    model = SegmentModel.load(args.model_path) if args.incremental else None
+    if model is None or not run_incremental(es, args, cache, model):
+        run_full(es, args, cache)
+    if cache is not None:
+        cache.report()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,169 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from elasticsearch import Elasticsearch
+
+from behavioral_segmentation import update_elasticsearch_with_segments
+
+
+class MockBulkServer:
+    """In-process stand-in for the Elasticsearch document and _bulk APIs
+
+    Each request sleeps `latency` seconds plus `per_item` per document to mimic a round trip
+    and indexing cost; `fail_rate` rejects a share of bulk items to exercise error reporting.
+    """
+
+    def __init__(self, latency=0.002, per_item=0.00002, fail_rate=0.0, seed=42):
+        self.latency = latency
+        self.per_item = per_item
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.documents = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _items(self, lines):
+        """Bulk response items for NDJSON action lines (each update/index line has a body)"""
+        items = []
+        i = 0
+        while i < len(lines):
+            action = json.loads(lines[i])
+            op_type, meta = next(iter(action.items()))
+            i += 1 if op_type == "delete" else 2
+            with self.lock:
+                failed = self.random.random() < self.fail_rate
+            if failed:
+                items.append({op_type: {"_index": meta.get("_index"), "_id": meta.get("_id"), "status": 400,
+                                        "error": {"type": "mapper_parsing_exception", "reason": "mock failure"}}})
+            else:
+                items.append({op_type: {"_index": meta.get("_index"), "_id": meta.get("_id"), "status": 200,
+                                        "result": "updated"}})
+        return items
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body go out separately, avoid delayed-ACK stalls
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, body):
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_HEAD(self):
+                self._send({})
+
+            def do_GET(self):
+                self._send({"version": {"number": "8.0.0"}, "tagline": "You Know, for Search"})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = self.path.split("?")[0]
+                if path.endswith("/_bulk"):
+                    items = mock._items([line for line in body.decode().splitlines() if line.strip()])
+                    response = {"took": 1, "errors": any(next(iter(i.values()))["status"] >= 300 for i in items),
+                                "items": items}
+                else:  # single document: /{index}/_update/{id} or /{index}/_doc
+                    items = [None]
+                    parts = path.strip("/").split("/")
+                    response = {"_index": parts[0], "_id": parts[-1], "result": "updated"}
+                time.sleep(mock.latency + mock.per_item * len(items))
+                with mock.lock:
+                    mock.requests += 1
+                    mock.documents += len(items)
+                self._send(response)
+
+            do_PUT = do_POST
+
+        return Handler
+
+
+def per_document_updates(es, user_segments):
+    """The previous write path: one update request per user"""
+    for user_id, segment in user_segments.items():
+        es.update(index="user_segments", id=user_id,
+                  doc={"segment": segment, "updated_at": "2025-01-01T00:00:00"}, doc_as_upsert=True)
+    return len(user_segments), []
+
+
+def run_benchmark(users, chunk_sizes, thread_counts, latency, per_item, fail_rate, single_limit):
+    segments = ["tech_enthusiast", "budget_conscious", "fashion_oriented", "luxury_seeker", "home_improvement"]
+    user_segments = {f"user_{i}": segments[i % len(segments)] for i in range(users)}
+    results = []
+
+    with MockBulkServer(latency, per_item, fail_rate) as mock:
+        es = Elasticsearch(mock.url, request_timeout=30)
+
+        def measure(name, func, docs):
+            mock.requests = 0
+            start_time = time.perf_counter()
+            succeeded, errors = func(docs)
+            elapsed = time.perf_counter() - start_time
+            results.append({"method": name, "documents": len(docs), "requests": mock.requests,
+                            "failed": len(errors), "seconds": elapsed, "docs_per_s": len(docs) / elapsed})
+
+        # Per-document writes are slow by design, so they run on a prefix and are compared by rate
+        single = dict(list(user_segments.items())[:single_limit])
+        measure("per-document update", lambda docs: per_document_updates(es, docs), single)
+        for chunk_size in chunk_sizes:
+            measure(f"streaming_bulk chunk={chunk_size}",
+                    lambda docs: update_elasticsearch_with_segments(es, docs, chunk_size, 1), user_segments)
+        for threads in thread_counts:
+            measure(f"parallel_bulk chunk={chunk_sizes[-1]} threads={threads}",
+                    lambda docs: update_elasticsearch_with_segments(es, docs, chunk_sizes[-1], threads),
+                    user_segments)
+
+    print(f"\nBulk write benchmark ({latency * 1000:.1f} ms per request, "
+          f"{per_item * 1e6:.0f} us per document, {fail_rate:.1%} injected failures)")
+    print(f"{'method':<38} {'docs':>8} {'requests':>9} {'failed':>7} {'seconds':>8} {'docs/s':>10}")
+    for r in results:
+        print(f"{r['method']:<38} {r['documents']:>8} {r['requests']:>9} {r['failed']:>7} "
+              f"{r['seconds']:>8.2f} {r['docs_per_s']:>10,.0f}")
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Segment write throughput against a mock bulk API")
+    parser.add_argument("--users", type=int, default=20_000, help="segments written per bulk run")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--threads", type=int, nargs="+", default=[2, 4], help="parallel_bulk thread counts")
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated seconds per request")
+    parser.add_argument("--per-item", type=float, default=0.00002, help="simulated seconds per document")
+    parser.add_argument("--fail-rate", type=float, default=0.0005, help="share of bulk items rejected")
+    parser.add_argument("--single-limit", type=int, default=1000,
+                        help="documents written one request at a time for the baseline")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_benchmark(args.users, args.chunk_sizes, args.threads, args.latency, args.per_item,
+                  args.fail_rate, args.single_limit)
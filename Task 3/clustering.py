@@ -0,0 +1,108 @@
+import numpy as np
+
+# scikit-learn and SciPy are imported inside the functions that fit or match centroids, so
+# nearest-centroid assignment against a stored model starts without loading them
+
+# Named segments and the searches that define them; centroids take the name of the closest seed
+SEGMENT_SEEDS = {
+    "tech_enthusiast": ["gaming laptop", "graphics card", "wireless earbuds", "smart watch"],
+    "budget_conscious": ["budget smartphone", "cheap deals", "discount coupons", "clearance sale"],
+    "fashion_oriented": ["designer shoes", "summer dress", "leather jacket", "fashion trends"],
+    "luxury_seeker": ["luxury watch", "premium handbag", "diamond jewelry", "first class travel"],
+    "home_improvement": ["home renovation", "power drill", "kitchen cabinets", "garden tools"],
+}
+
+
+def iter_batches(data, batch_size, rng=None):
+    """Row blocks of `data` (an array or memmap), in shuffled block order when rng is given"""
+    starts = np.arange(0, len(data), batch_size)
+    if rng is not None:
+        rng.shuffle(starts)
+    for start in starts:
+        yield np.asarray(data[start:start + batch_size], dtype=np.float32)
+
+
+def sample_rows(data, sample_size, random_state=42):
+    rng = np.random.default_rng(random_state)
+    if len(data) <= sample_size:
+        return np.asarray(data, dtype=np.float32)
+    return np.asarray(data[np.sort(rng.choice(len(data), sample_size, replace=False))], dtype=np.float32)
+
+
+def select_k(data, k_values, sample_size=10_000, random_state=42):
+    """Pick the k with the best silhouette score on a random sample; returns (k, {k: score})"""
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+    sample = sample_rows(data, sample_size, random_state)
+    scores = {}
+    for k in k_values:
+        if not 2 <= k < len(sample):
+            continue
+        labels = MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3).fit_predict(sample)
+        if len(np.unique(labels)) > 1:
+            scores[k] = float(silhouette_score(sample, labels, sample_size=min(len(sample), 5000),
+                                               random_state=random_state))
+    if not scores:
+        raise ValueError(f"no k in {list(k_values)} can be scored on {len(sample)} samples")
+    return max(scores, key=scores.get), scores
+
+
+def fit_streaming(data, n_clusters, batch_size=4096, epochs=3, random_state=42):
+    """MiniBatchKMeans trained with partial_fit, one row block at a time
+
+    Only one block is materialized at once, so `data` can be a memmap far larger than RAM.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    n_clusters = min(n_clusters, len(data))
+    model = MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, batch_size=batch_size)
+    rng = np.random.default_rng(random_state)
+    # partial_fit seeds the centroids from its first block, which must hold at least k rows
+    model.partial_fit(sample_rows(data, max(batch_size, 3 * n_clusters), random_state))
+    for _ in range(epochs):
+        for batch in iter_batches(data, batch_size, rng):
+            if len(batch) >= n_clusters:
+                model.partial_fit(batch)
+    return model
+
+
+def predict_streaming(model, data, batch_size=4096):
+    if len(data) == 0:
+        return np.empty(0, dtype=np.int32)
+    return np.concatenate([model.predict(batch) for batch in iter_batches(data, batch_size)])
+
+
+def label_centroids(centroids, seed_vectors):
+    """{cluster_id: segment name} by cosine similarity of centroids to the seed vectors
+
+    Up to one cluster per segment, names are matched one-to-one (Hungarian assignment);
+    with more clusters than segments each cluster takes its most similar segment.
+    """
+    from scipy.optimize import linear_sum_assignment
+    names = list(seed_vectors)
+    seeds = np.vstack([seed_vectors[name] for name in names])
+    seeds /= np.maximum(np.linalg.norm(seeds, axis=1, keepdims=True), 1e-12)
+    # Seeds live in query-embedding space, so only the matching leading dimensions are compared
+    centers = centroids[:, :seeds.shape[1]]
+    centers = centers / np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+    similarity = centers @ seeds.T
+    if len(centers) <= len(names):
+        rows, cols = linear_sum_assignment(-similarity)
+        return {int(r): names[c] for r, c in zip(rows, cols)}
+    return {i: names[j] for i, j in enumerate(similarity.argmax(axis=1))}
+
+
+def nearest_centroid(data, centroids, batch_size=65_536):
+    """(cluster ids, euclidean distances) of every row to its closest centroid
+
+    Uses ||x||^2 - 2 x.c + ||c||^2 over row blocks, so it is one matrix product per block.
+    """
+    centroids = np.asarray(centroids, dtype=np.float32)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    ids = np.empty(len(data), dtype=np.int32)
+    distances = np.empty(len(data), dtype=np.float32)
+    for start in range(0, len(data), batch_size):
+        block = np.asarray(data[start:start + batch_size], dtype=np.float32)
+        squared = (block ** 2).sum(axis=1)[:, None] - 2 * block @ centroids.T + centroid_norms
+        ids[start:start + len(block)] = squared.argmin(axis=1)
+        distances[start:start + len(block)] = np.sqrt(np.maximum(squared.min(axis=1), 0))
+    return ids, distances
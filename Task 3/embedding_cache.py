@@ -0,0 +1,143 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from quantization import STORAGE_DTYPES, QuantizedMatrix, quantize_rows
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+
+def normalize_query(text):
+    """Cache key of a search query: lower case, whitespace collapsed"""
+    return " ".join(str(text).lower().split())
+
+
+MATRIX_FILES = {"float32": "embeddings.f32", "float16": "embeddings.f16", "int8": "embeddings.i8"}
+
+
+class EmbeddingCache:
+    """On-disk query embedding cache: a memory-mapped embedding matrix plus an index file
+
+    Row i of the matrix belongs to line i of keys.txt (one normalized query per line).
+    Rows are stored as float32, float16 or int8 (with a float32 scale per row in scales.f32).
+    All files only grow by appending, so a crash can at worst lose the rows of the last batch.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, dim=384, model_name="all-MiniLM-L6-v2", dtype=None):
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self.model_name = model_name
+        self.meta_path = os.path.join(cache_dir, "meta.json")
+        self.keys_path = os.path.join(cache_dir, "keys.txt")
+        os.makedirs(cache_dir, exist_ok=True)
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            stored_dtype = meta.get("dtype", "float32")
+            if meta["model"] != model_name or meta["dim"] != dim or dtype not in (None, stored_dtype):
+                raise ValueError(f"cache at {cache_dir} holds {meta['model']} ({meta['dim']}d, {stored_dtype}) "
+                                 f"embeddings, not {model_name} ({dim}d, {dtype}); use another --cache-dir")
+            self.dtype = stored_dtype
+        else:
+            self.dtype = dtype or "float32"
+            with open(self.meta_path, "w") as f:
+                json.dump({"model": model_name, "dim": dim, "dtype": self.dtype}, f)
+        self.matrix_path = os.path.join(cache_dir, MATRIX_FILES[self.dtype])
+        self.scales_path = os.path.join(cache_dir, "scales.f32")
+        self.scales = None
+
+        self.index = {}
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, encoding="utf-8") as f:
+                for row, line in enumerate(f):
+                    self.index[line.rstrip("\n")] = row
+        self.rows = len(self.index)
+        self.matrix = None
+        self._open(max(self.rows, 1024))
+
+        self.hits = 0
+        self.misses = 0
+        self.encoded = 0
+        self.encode_seconds = 0.0
+
+    @staticmethod
+    def _map(path, dtype, capacity, width):
+        """Memory-map `path` as rows of `width` values, growing the file to hold `capacity` rows"""
+        row_bytes = width * np.dtype(dtype).itemsize
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < capacity * row_bytes:
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+            size = capacity * row_bytes
+        shape = (size // row_bytes, width) if width > 1 else (size // row_bytes,)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open(self, capacity):
+        """(Re)map the matrix (and int8 scales) with room for at least `capacity` rows"""
+        if self.matrix is not None:
+            self.matrix.flush()
+        self.matrix = self._map(self.matrix_path, STORAGE_DTYPES[self.dtype], capacity, self.dim)
+        if self.dtype == "int8":
+            self.scales = self._map(self.scales_path, np.float32, len(self.matrix), 1)
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, query):
+        return normalize_query(query) in self.index
+
+    def _append(self, keys, vectors):
+        if self.rows + len(keys) > self.matrix.shape[0]:
+            self._open(max(self.rows + len(keys), 2 * self.matrix.shape[0]))
+        stored, scales = quantize_rows(vectors, self.dtype)
+        self.matrix[self.rows:self.rows + len(keys)] = stored
+        self.matrix.flush()
+        if scales is not None:
+            self.scales[self.rows:self.rows + len(keys)] = scales
+            self.scales.flush()
+        with open(self.keys_path, "a", encoding="utf-8") as f:
+            f.writelines(key + "\n" for key in keys)
+        for offset, key in enumerate(keys):
+            self.index[key] = self.rows + offset
+        self.rows += len(keys)
+
+    def get(self, queries, encode, batch_size=64):
+        """Embeddings for `queries` (one row each); only unseen queries are passed to `encode`
+
+        `encode` takes a list of strings and returns an (n, dim) array. Misses are encoded and
+        written to disk `batch_size` queries at a time.
+        """
+        keys = [normalize_query(q) for q in queries]
+        missing = list(dict.fromkeys(key for key in keys if key not in self.index))
+        missing_set = set(missing)
+        misses = sum(key in missing_set for key in keys)
+        self.misses += misses
+        self.hits += len(keys) - misses
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            start_time = time.perf_counter()
+            vectors = np.asarray(encode(batch), dtype=np.float32)
+            self.encode_seconds += time.perf_counter() - start_time
+            self._append(batch, vectors)
+        self.encoded += len(missing)
+
+        rows = np.fromiter((self.index[key] for key in keys), dtype=np.int64, count=len(keys))
+        return self.stored()[rows]
+
+    def stored(self):
+        """All cached rows as a QuantizedMatrix (float32 rows come back as they are)"""
+        return QuantizedMatrix(self.matrix[:self.rows], None if self.scales is None else self.scales[:self.rows])
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        throughput = self.encoded / self.encode_seconds if self.encode_seconds > 0 else 0.0
+        print(f"Embedding cache: {self.hits:,}/{total:,} queries served from cache ({hit_rate:.1%} hit rate), "
+              f"{self.encoded:,} new queries encoded in {self.encode_seconds:.2f}s ({throughput:,.0f} queries/s), "
+              f"{self.rows:,} cached in total")
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": hit_rate,
+                "encoded": self.encoded, "encode_seconds": self.encode_seconds, "queries_per_s": throughput}
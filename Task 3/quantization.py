@@ -0,0 +1,127 @@
+import argparse
+import time
+
+import numpy as np
+
+STORAGE_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def quantize_rows(block, dtype):
+    """(stored rows, per-row scales or None); int8 is symmetric per row: x ~ scale * q"""
+    block = np.asarray(block, dtype=np.float32)
+    if dtype != "int8":
+        return block.astype(STORAGE_DTYPES[dtype]), None
+    scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127
+    return np.clip(np.rint(block / scales[:, None]), -127, 127).astype(np.int8), scales.astype(np.float32)
+
+
+class QuantizedMatrix:
+    """Row-major embeddings kept as float16 or int8; rows come back as float32 when indexed
+
+    Slicing dequantizes only the requested rows, so the clustering and nearest-centroid code,
+    which already works one row block at a time, runs over it without a float32 copy.
+    """
+
+    def __init__(self, data, scales=None):
+        self.data = data
+        self.scales = scales
+
+    @classmethod
+    def from_float(cls, matrix, dtype="int8", batch_size=65_536):
+        n, dim = matrix.shape
+        data = np.empty((n, dim), dtype=STORAGE_DTYPES[dtype])
+        scales = np.empty(n, dtype=np.float32) if dtype == "int8" else None
+        for start in range(0, n, batch_size):
+            rows, row_scales = quantize_rows(matrix[start:start + batch_size], dtype)
+            data[start:start + len(rows)] = rows
+            if scales is not None:
+                scales[start:start + len(rows)] = row_scales
+        return cls(data, scales)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, rows):
+        block = np.asarray(self.data[rows], dtype=np.float32)
+        if self.scales is not None:
+            scales = np.asarray(self.scales[rows], dtype=np.float32)
+            block *= scales[..., None] if block.ndim > scales.ndim else scales
+        return block
+
+    def __array__(self, dtype=None, copy=None):
+        return self[:].astype(dtype or np.float32, copy=False)
+
+
+def matched_agreement(labels, reference, n_clusters):
+    """Share of rows in the same cluster as the reference after matching cluster ids one-to-one"""
+    from scipy.optimize import linear_sum_assignment
+    confusion = np.zeros((n_clusters, n_clusters), dtype=np.int64)
+    np.add.at(confusion, (labels, reference), 1)
+    rows, cols = linear_sum_assignment(-confusion)
+    return confusion[rows, cols].sum() / len(labels)
+
+
+def benchmark(profiles, n_clusters=5, batch_size=4096):
+    """Memory, fit/assign time and segment agreement of each storage dtype against float32"""
+    from clustering import fit_streaming, nearest_centroid, predict_streaming
+    reference_model = fit_streaming(profiles, n_clusters, batch_size)
+    reference_fit = predict_streaming(reference_model, profiles, batch_size)
+    reference_assign, _ = nearest_centroid(profiles, reference_model.cluster_centers_)
+
+    print(f"{'storage':<9} {'memory MB':>10} {'fit s':>7} {'assign s':>9} {'same centroids':>15} {'refit':>7}")
+    results = []
+    for dtype in STORAGE_DTYPES:
+        data = profiles if dtype == "float32" else QuantizedMatrix.from_float(profiles, dtype)
+        start_time = time.perf_counter()
+        model = fit_streaming(data, n_clusters, batch_size)
+        labels = predict_streaming(model, data, batch_size)
+        fit_seconds = time.perf_counter() - start_time
+
+        # Assignment to the float32 centroids isolates the quantization error from k-means noise
+        start_time = time.perf_counter()
+        assigned, _ = nearest_centroid(data, reference_model.cluster_centers_)
+        assign_seconds = time.perf_counter() - start_time
+
+        same = float(np.mean(assigned == reference_assign))
+        refit = float(matched_agreement(labels, reference_fit, n_clusters))
+        print(f"{dtype:<9} {data.nbytes / 2**20:>10.1f} {fit_seconds:>7.2f} {assign_seconds:>9.3f} "
+              f"{same:>15.2%} {refit:>7.2%}")
+        results.append({"storage": dtype, "memory_bytes": data.nbytes, "fit_s": fit_seconds,
+                        "assign_s": assign_seconds, "same_centroid_agreement": same, "refit_agreement": refit})
+    return results
+
+
+def synthetic_profiles(n_users, dim=416, n_topics=20, seed=42):
+    """Unit-length profile-like vectors drawn around a few topic directions"""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(n_topics, dim)).astype(np.float32)
+    profiles = topics[rng.integers(0, n_topics, n_users)] + 1.5 * rng.normal(size=(n_users, dim)).astype(np.float32)
+    return profiles / np.linalg.norm(profiles, axis=1, keepdims=True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare float32, float16 and int8 embedding storage")
+    parser.add_argument("--source", choices=["synthetic", "cache"], default="synthetic",
+                        help="synthetic profiles, or the query embeddings in the embedding cache")
+    parser.add_argument("--users", type=int, default=200_000, help="synthetic profiles generated")
+    parser.add_argument("--clusters", type=int, default=5)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.source == "cache":
+        from embedding_cache import EmbeddingCache
+        profiles = np.asarray(EmbeddingCache().stored())
+    else:
+        profiles = synthetic_profiles(args.users)
+    print(f"{len(profiles):,} vectors of dimension {profiles.shape[1]}")
+    benchmark(profiles, args.clusters)
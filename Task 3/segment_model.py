@@ -0,0 +1,65 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from clustering import nearest_centroid
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "segment_model.npz")
+
+
+class SegmentModel:
+    """Fitted centroids, their segment names and the session watermark of the last run
+
+    baseline_distance is the mean distance of users to their centroid at fit time; incremental
+    runs compare new assignments against it to decide when a full refit is due.
+    """
+
+    def __init__(self, centroids, label_map, baseline_distance, watermark=None,
+                 click_buckets=32, half_life_days=None, fitted_at=None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.label_map = {int(k): v for k, v in label_map.items()}
+        self.baseline_distance = float(baseline_distance)
+        self.watermark = watermark  # ISO timestamp of the newest session folded in
+        self.click_buckets = click_buckets
+        self.half_life_days = half_life_days
+        self.fitted_at = fitted_at or datetime.now(timezone.utc).isoformat()
+
+    @classmethod
+    def fit(cls, profiles, centroids, label_map, latest=None, click_buckets=32, half_life_days=None):
+        _, distances = nearest_centroid(profiles, centroids)
+        watermark = datetime.fromtimestamp(latest, timezone.utc).isoformat() if latest is not None else None
+        return cls(centroids, label_map, distances.mean() if len(distances) else 0.0, watermark,
+                   click_buckets, half_life_days)
+
+    def assign(self, profiles):
+        """(segment names, distances) of profiles to the nearest stored centroid"""
+        ids, distances = nearest_centroid(profiles, self.centroids)
+        return [self.label_map[int(i)] for i in ids], distances
+
+    def drift(self, distances):
+        """Mean distance of newly assigned users relative to the fit-time baseline"""
+        if len(distances) == 0 or self.baseline_distance <= 0:
+            return 1.0
+        return float(np.mean(distances)) / self.baseline_distance
+
+    def save(self, path=MODEL_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = {
+            "label_map": self.label_map, "baseline_distance": self.baseline_distance,
+            "watermark": self.watermark, "click_buckets": self.click_buckets,
+            "half_life_days": self.half_life_days, "fitted_at": self.fitted_at,
+        }
+        np.savez(path, centroids=self.centroids, meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        """The stored model, or None before the first full run"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            centroids = data["centroids"]
+            meta = json.loads(str(data["meta"]))
+        return cls(centroids, meta["label_map"], meta["baseline_distance"], meta["watermark"],
+                   meta["click_buckets"], meta["half_life_days"], meta["fitted_at"])
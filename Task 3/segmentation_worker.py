@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib import request as urlrequest
+
+import numpy as np
+
+from behavioral_segmentation import (MODEL_NAME, connect_to_elasticsearch, get_embeddings, get_model,
+                                     update_elasticsearch_with_segments)
+from clustering import SEGMENT_SEEDS
+from embedding_cache import CACHE_DIR, EmbeddingCache
+from segment_model import MODEL_PATH, SegmentModel
+from user_profiles import UserProfileBuilder
+
+
+class SegmentationWorker:
+    """Keeps the embedding model, the embedding cache and the stored centroids loaded
+
+    A batch is a list of session dicts shaped like user_sessions documents. Each batch is
+    folded into per-user profiles and assigned to the nearest stored centroid, so after
+    startup a batch costs only its own encoding and a matrix product.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, cache_dir=CACHE_DIR, batch_size=64):
+        start_time = time.perf_counter()
+        get_model()
+        self.batch_size = batch_size
+        self.cache = EmbeddingCache(cache_dir, model_name=MODEL_NAME) if cache_dir else None
+        self.segment_model = SegmentModel.load(model_path) or self._seed_model()
+        self.es = None
+        self.batches = 0
+        self.users = 0
+        self.startup_seconds = time.perf_counter() - start_time
+
+    def _seed_model(self, click_buckets=32):
+        """Before the first full run, users go to the segment whose seed phrases are closest"""
+        names = list(SEGMENT_SEEDS)
+        seeds = np.vstack([np.asarray(get_embeddings(SEGMENT_SEEDS[name], self.cache)).mean(axis=0)
+                           for name in names])
+        seeds /= np.maximum(np.linalg.norm(seeds, axis=1, keepdims=True), 1e-12)
+        centroids = np.hstack([seeds, np.zeros((len(names), click_buckets), dtype=seeds.dtype)])
+        return SegmentModel(centroids, dict(enumerate(names)), 0.0, click_buckets=click_buckets)
+
+    def segment(self, sessions, write=False):
+        """{user_id: segment} for one batch of sessions, optionally bulk-written to user_segments"""
+        builder = UserProfileBuilder(click_buckets=self.segment_model.click_buckets,
+                                     half_life_days=self.segment_model.half_life_days)
+        embeddings = get_embeddings([session['search_query'] for session in sessions], self.cache, self.batch_size)
+        builder.add_sessions(sessions, embeddings)
+        user_ids, profiles = builder.profiles()
+        segments, _ = self.segment_model.assign(profiles)
+        user_segments = dict(zip(user_ids, segments))
+        if write and user_segments:
+            if self.es is None:
+                self.es = connect_to_elasticsearch()
+            update_elasticsearch_with_segments(self.es, user_segments)
+        self.batches += 1
+        self.users += len(user_segments)
+        return user_segments
+
+    def health(self):
+        return {"status": "ok", "startup_seconds": self.startup_seconds, "batches": self.batches,
+                "users": self.users, "cached_queries": len(self.cache) if self.cache else 0}
+
+
+def serve(worker, host="127.0.0.1", port=8765):
+    """Answer GET /health and POST /segment {"sessions": [...], "write": false} until interrupted"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, worker.health())
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/segment":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            try:
+                batch = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                start_time = time.perf_counter()
+                segments = worker.segment(batch["sessions"], batch.get("write", False))
+                self._send(200, {"segments": segments, "seconds": time.perf_counter() - start_time})
+            except KeyError as e:
+                self._send(400, {"error": f"missing field {e}"})
+            except (TypeError, ValueError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                # Elasticsearch or the model failed; the client still gets an answer
+                print(f"Error segmenting a batch: {type(e).__name__}: {e}")
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    server = HTTPServer((host, port), Handler)
+    print(f"Segmentation worker ready on http://{host}:{port} after {worker.startup_seconds:.2f}s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def post_batch(url, sessions, write=False):
+    """Send one batch to a running worker and return its {user_id: segment}"""
+    data = json.dumps({"sessions": sessions, "write": write}).encode()
+    req = urlrequest.Request(f"{url}/segment", data=data, headers={"Content-Type": "application/json"})
+    with urlrequest.urlopen(req, timeout=300) as response:
+        return json.loads(response.read())["segments"]
+
+
+def sample_sessions():
+    """A small batch built from the seed phrases, two sessions per user"""
+    phrases = [phrase for seeds in SEGMENT_SEEDS.values() for phrase in seeds]
+    return [{"user_id": f"user_{i // 2}", "search_query": phrase, "clicked_product_ids": [f"product_{i}"]}
+            for i, phrase in enumerate(phrases)]
+
+
+def _timed_run(command, runs, cwd):
+    timings = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, cwd=cwd)
+        timings.append(time.perf_counter() - start_time)
+    return float(np.median(timings))
+
+
+def benchmark(runs=3, requests=20, cache_dir=CACHE_DIR, model_path=MODEL_PATH):
+    """Import time, a cold one-shot batch, worker startup and warm per-batch latency"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.abspath(__file__)
+    sessions = sample_sessions()
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(sessions, f)
+        batch_path = f.name
+    common = ["--cache-dir", cache_dir, "--model-path", model_path]
+
+    try:
+        import_seconds = _timed_run([sys.executable, "-c", "import behavioral_segmentation"], runs, here)
+        cold_seconds = _timed_run([sys.executable, script, "segment", batch_path] + common, runs, here)
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        url = f"http://127.0.0.1:{port}"
+        start_time = time.perf_counter()
+        worker = subprocess.Popen([sys.executable, script, "serve", "--port", str(port)] + common,
+                                  stdout=subprocess.DEVNULL, cwd=here)
+        try:
+            while True:
+                if worker.poll() is not None:
+                    raise RuntimeError("worker exited during startup")
+                try:
+                    with urlrequest.urlopen(f"{url}/health", timeout=1):
+                        break
+                except OSError:
+                    time.sleep(0.05)
+            ready_seconds = time.perf_counter() - start_time
+            latencies = []
+            for _ in range(requests):
+                start_time = time.perf_counter()
+                post_batch(url, sessions)
+                latencies.append(time.perf_counter() - start_time)
+        finally:
+            worker.terminate()
+            worker.wait()
+    finally:
+        os.unlink(batch_path)
+
+    warm_seconds = float(np.median(latencies))
+    print(f"Batch of {len(sessions)} sessions, {len({s['user_id'] for s in sessions})} users")
+    print(f"Import behavioral_segmentation:  {import_seconds * 1000:8.1f} ms")
+    print(f"Cold one-shot run (new process): {cold_seconds * 1000:8.1f} ms")
+    print(f"Worker startup until ready:      {ready_seconds * 1000:8.1f} ms (once)")
+    print(f"Warm batch on the worker:        {warm_seconds * 1000:8.1f} ms median, "
+          f"{np.percentile(latencies, 95) * 1000:.1f} ms p95")
+    print(f"Warm batches are {cold_seconds / warm_seconds:.0f}x faster than cold runs")
+    return {"import_s": import_seconds, "cold_s": cold_seconds, "ready_s": ready_seconds, "warm_s": warm_seconds}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Long-lived segmentation worker that keeps the model warm")
+    parser.add_argument("command", choices=["serve", "segment", "benchmark"],
+                        help="serve: HTTP worker, segment: one batch from a JSON file, benchmark: startup costs")
+    parser.add_argument("file", nargs="?", help="segment: JSON list of sessions")
+    parser.add_argument("--url", help="segment: send the batch to a running worker instead of loading the model")
+    parser.add_argument("--write", action="store_true", help="also bulk-write the segments to Elasticsearch")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="embedding cache shared with full runs")
+    parser.add_argument("--model-path", default=MODEL_PATH, help="centroids saved by behavioral_segmentation.py")
+    parser.add_argument("--runs", type=int, default=3, help="benchmark: cold runs per measurement")
+    parser.add_argument("--requests", type=int, default=20, help="benchmark: warm batches sent to the worker")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "serve":
+        serve(SegmentationWorker(args.model_path, args.cache_dir), args.host, args.port)
+    elif args.command == "segment":
+        with open(args.file) as f:
+            sessions = json.load(f)
+        if args.url:
+            segments = post_batch(args.url, sessions, args.write)
+        else:
+            segments = SegmentationWorker(args.model_path, args.cache_dir).segment(sessions, args.write)
+        print(json.dumps(segments, indent=2))
+    else:
+        benchmark(args.runs, args.requests, args.cache_dir, args.model_path)
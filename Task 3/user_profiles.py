@@ -0,0 +1,117 @@
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+
+from quantization import STORAGE_DTYPES, QuantizedMatrix, quantize_rows
+
+
+def parse_timestamp(value):
+    """Epoch seconds of an ISO-8601 session timestamp (naive values are taken as UTC)"""
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class UserProfileBuilder:
+    """Folds session batches into one profile vector per user
+
+    Per user it keeps a weighted sum of query embeddings and of hashed click features, so
+    memory grows with the number of users, not sessions. With half_life_days set, a session
+    counts 0.5 ** (age / half_life) so recent searches dominate the profile.
+    """
+
+    def __init__(self, dim=384, click_buckets=32, click_weight=0.5, half_life_days=None, now=None):
+        self.dim = dim
+        self.click_buckets = click_buckets
+        self.click_weight = click_weight
+        self.half_life_days = half_life_days
+        self.now = (now or datetime.now(timezone.utc)).timestamp()
+        self.user_index = {}
+        self.user_ids = []
+        self.query_sums = np.zeros((1024, dim), dtype=np.float32)
+        self.click_sums = np.zeros((1024, click_buckets), dtype=np.float32)
+        self.weights = np.zeros(1024, dtype=np.float64)
+        self.sessions = 0
+        self.latest = None  # newest session timestamp seen, epoch seconds
+
+    def _rows(self, user_ids):
+        rows = np.empty(len(user_ids), dtype=np.int64)
+        for i, user_id in enumerate(user_ids):
+            row = self.user_index.get(user_id)
+            if row is None:
+                row = self.user_index[user_id] = len(self.user_ids)
+                self.user_ids.append(user_id)
+            rows[i] = row
+        if len(self.user_ids) > self.weights.size:
+            grow = max(len(self.user_ids), 2 * self.weights.size) - self.weights.size
+            self.query_sums = np.vstack([self.query_sums, np.zeros((grow, self.dim), np.float32)])
+            self.click_sums = np.vstack([self.click_sums, np.zeros((grow, self.click_buckets), np.float32)])
+            self.weights = np.concatenate([self.weights, np.zeros(grow)])
+        return rows
+
+    def _session_weights(self, n, timestamps):
+        if self.half_life_days is None or timestamps is None:
+            return np.ones(n, dtype=np.float64)
+        ages = np.array([(self.now - parse_timestamp(ts)) / 86400 if ts else 0.0 for ts in timestamps])
+        return 0.5 ** (np.maximum(ages, 0) / self.half_life_days)
+
+    def click_features(self, clicked_product_ids):
+        """Feature-hashed bag of clicked products, one row per session"""
+        features = np.zeros((len(clicked_product_ids), self.click_buckets), dtype=np.float32)
+        for i, products in enumerate(clicked_product_ids):
+            for product_id in products or []:
+                features[i, zlib.crc32(str(product_id).encode()) % self.click_buckets] += 1
+        return features
+
+    def add_batch(self, user_ids, embeddings, clicked_product_ids, timestamps=None):
+        """Fold one batch of sessions into the running per-user sums"""
+        if len(user_ids) == 0:
+            return
+        rows = self._rows(user_ids)
+        weights = self._session_weights(len(user_ids), timestamps)
+        column = weights[:, None].astype(np.float32)
+        np.add.at(self.query_sums, rows, np.asarray(embeddings, dtype=np.float32) * column)
+        np.add.at(self.click_sums, rows, self.click_features(clicked_product_ids) * column)
+        np.add.at(self.weights, rows, weights)
+        self.sessions += len(user_ids)
+
+    def add_sessions(self, sessions, embeddings):
+        """add_batch for a page of session _source dicts and their query embeddings"""
+        timestamps = [session.get('timestamp') for session in sessions]
+        seen = [parse_timestamp(ts) for ts in timestamps if ts]
+        if seen:
+            self.latest = max(seen) if self.latest is None else max(self.latest, max(seen))
+        self.add_batch(
+            [session['user_id'] for session in sessions],
+            embeddings,
+            [session.get('clicked_product_ids') for session in sessions],
+            timestamps if self.half_life_days is not None else None
+        )
+
+    def _profile_block(self, start, stop):
+        weights = np.maximum(self.weights[start:stop], 1e-12)[:, None].astype(np.float32)
+        queries = self.query_sums[start:stop] / weights
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        clicks = self.click_sums[start:stop] / weights
+        clicks /= np.maximum(np.linalg.norm(clicks, axis=1, keepdims=True), 1e-12)
+        return np.hstack([queries, self.click_weight * clicks]).astype(np.float32)
+
+    def profiles(self, dtype="float32", batch_size=65_536):
+        """(user_ids, profile matrix): unit-length mean query embedding next to scaled click features
+
+        With dtype float16 or int8 the matrix is a QuantizedMatrix filled block by block, so no
+        normalized float32 copy is built next to it. The running sums themselves stay float32.
+        """
+        n = len(self.user_ids)
+        if dtype == "float32":
+            return list(self.user_ids), self._profile_block(0, n)
+        data = np.empty((n, self.dim + self.click_buckets), dtype=STORAGE_DTYPES[dtype])
+        scales = np.empty(n, dtype=np.float32) if dtype == "int8" else None
+        for start in range(0, n, batch_size):
+            rows, row_scales = quantize_rows(self._profile_block(start, min(start + batch_size, n)), dtype)
+            data[start:start + len(rows)] = rows
+            if scales is not None:
+                scales[start:start + len(rows)] = row_scales
+        return list(self.user_ids), QuantizedMatrix(data, scales)
@@ -1,24 +1,22 @@
 import os
 import json
 import pandas as pd
-import psycopg2
 import requests
+import sys
 from dotenv import load_dotenv
 from datetime import datetime
 from collections import Counter, defaultdict
+from pathlib import Path
 import time
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import get_connection, release_connection
+
 # Load environment variables
 load_dotenv()
  
 class DynamicEcommerceEventAnalyzer:
     def __init__(self):
-        self.db_params = {
-            'dbname': 'e-commerce_platform', # Replace with your DB name if different
-            'user': 'postgres',             # Replace with your DB user if different
-            'password': 'Your_Pass', # Replace with your actual DB password
-            'host': 'localhost'             # Replace with your DB host if different
-        }
         self.connection = None
         
         # Mistral AI Configuration
@@ -45,7 +43,8 @@ class DynamicEcommerceEventAnalyzer:
     def connect_db(self):
         """Connect to PostgreSQL database"""
         try:
-            self.connection = psycopg2.connect(**self.db_params)
+            # Pooled connection, configured through the PG* environment variables (.env)
+            self.connection = get_connection()
             print("✅ Connected to database")
             return True
         except Exception as e:
@@ -330,8 +329,9 @@ Category:"""
         """Close database connection"""
         if self.connection:
             try:
-                self.connection.close()
-                print("🔐 Database connection closed")
+                release_connection(self.connection)
+                self.connection = None
+                print("🔐 Database connection returned to pool")
             except Exception as e:
                 print(f"❌ Error closing database connection: {e}")
         else:
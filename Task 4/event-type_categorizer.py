@@ -1,24 +1,22 @@
 import os
 import json
 import pandas as pd
-import psycopg2
 import requests
+import sys
 from dotenv import load_dotenv
 from datetime import datetime
 from collections import Counter, defaultdict
+from pathlib import Path
 import time
 
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from common.db import get_connection, release_connection
+
 # Load environment variables
 load_dotenv()
 
 class DynamicEcommerceEventAnalyzer:
     def __init__(self):
-        self.db_params = {
-            'dbname': 'e-commerce_platform',
-            'user': 'postgres',
-            'password': 'YourPasswordHere',
-            'host': 'localhost'
-        }
         self.connection = None
         self.ollama_url = "http://localhost:11434/api/generate"
         self.model_name = "tinyllama"
@@ -29,7 +27,8 @@ class DynamicEcommerceEventAnalyzer:
     def connect_db(self):
         """Connect to PostgreSQL database"""
         try:
-            self.connection = psycopg2.connect(**self.db_params)
+            # Pooled connection, configured through the PG* environment variables (.env)
+            self.connection = get_connection()
             print("✅ Connected to database")
             return True
         except Exception as e:
@@ -253,8 +252,9 @@ Respond with only the category name (Browsing, Consideration, Conversion, or Rem
     def close_connection(self):
         """Close database connection"""
         if self.connection:
-            self.connection.close()
-            print("🔐 Database connection closed")
+            release_connection(self.connection)
+            self.connection = None
+            print("🔐 Database connection returned to pool")
 
 def main():
     """Main function to run analysis"""
@@ -0,0 +1,150 @@
+import os
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+_pools = {}
+_released_at = {}  # id(connection) -> when it went back to the pool
+
+# Advisory lock held shared by event loads and exclusively by incremental refreshes, so a
+# refresh never reads an event_id range that still has uncommitted rows inside it
+EVENT_LOAD_LOCK = 72_001
+
+
+def get_db_params():
+    """Connection parameters from the standard libpq environment variables"""
+    return {
+        "dbname": os.getenv("PGDATABASE", "e-commerce_platform"),
+        "user": os.getenv("PGUSER", "postgres"),
+        "password": os.getenv("PGPASSWORD", "Your Password"),
+        "host": os.getenv("PGHOST", "localhost"),
+        "port": int(os.getenv("PGPORT", "5432")),
+    }
+
+
+def _create_pool(max_connections):
+    return pool.ThreadedConnectionPool(int(os.getenv("DB_POOL_MIN", "1")), max_connections, **get_db_params())
+
+
+def get_pool():
+    """Connection pool of the current process, created on first use
+
+    Pools are keyed by pid so forked workers never share sockets with their parent.
+    """
+    pid = os.getpid()
+    if pid not in _pools:
+        _pools[pid] = _create_pool(int(os.getenv("DB_POOL_MAX", "20")))
+    return _pools[pid]
+
+
+def ensure_pool_size(max_connections):
+    """Make the current process's pool allow at least max_connections borrowed at once
+
+    A smaller pool is rebuilt if none of its connections are borrowed; otherwise PoolError.
+    """
+    pid = os.getpid()
+    db_pool = _pools.get(pid)
+    if db_pool is not None and db_pool.maxconn < max_connections:
+        if db_pool._used:
+            raise pool.PoolError(f"pool allows {db_pool.maxconn} connections and {len(db_pool._used)} "
+                                 f"are borrowed, cannot grow it to {max_connections}")
+        close_pool()
+        db_pool = None
+    if db_pool is None:
+        _pools[pid] = _create_pool(max(max_connections, int(os.getenv("DB_POOL_MAX", "20"))))
+    return _pools[pid]
+
+
+def _is_usable(conn):
+    return (not conn.closed
+            and conn.info.transaction_status != extensions.TRANSACTION_STATUS_UNKNOWN)
+
+
+def _responds(conn):
+    """Round-trip SELECT 1, for sockets the server or network may have dropped while idle"""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def get_connection():
+    """Borrow a connection from the pool, replacing it if it is broken
+
+    libpq only notices some drops on the next query, so a connection that sat idle in the pool
+    for more than DB_POOL_PING_AFTER seconds (default 30) is pinged before it is handed out.
+    """
+    db_pool = get_pool()
+    ping_after = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+    conn = db_pool.getconn()
+    idle_since = _released_at.pop(id(conn), None)
+    stale = idle_since is not None and time.monotonic() - idle_since > ping_after
+    if not _is_usable(conn) or (stale and not _responds(conn)):
+        db_pool.putconn(conn, close=True)
+        conn = db_pool.getconn()
+        _released_at.pop(id(conn), None)
+    return conn
+
+
+def release_connection(conn):
+    """Return a borrowed connection, rolled back so the next user starts clean"""
+    db_pool = get_pool()
+    if _is_usable(conn):
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        _released_at[id(conn)] = time.monotonic()
+        db_pool.putconn(conn)
+    else:
+        db_pool.putconn(conn, close=True)
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of a with block"""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+
+def check_health():
+    """Round-trip a trivial query and report latency, server version and pool usage"""
+    start_time = time.perf_counter()
+    try:
+        with connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            version = conn.server_version
+    except psycopg2.Error as e:
+        return {"ok": False, "error": str(e)}
+    db_pool = get_pool()
+    return {
+        "ok": True,
+        "latency_ms": (time.perf_counter() - start_time) * 1000,
+        "server_version": version,
+        "pool_in_use": len(db_pool._used),
+        "pool_idle": len(db_pool._pool),
+    }
+
+
+def close_pool():
+    db_pool = _pools.pop(os.getpid(), None)
+    if db_pool:
+        db_pool.closeall()
+
+
+if __name__ == "__main__":
+    print(check_health())